@@ -0,0 +1,75 @@
+"""
+Cold start benchmark for the playlist randomizer.
+
+Imports the core modules in a fresh interpreter, several times, and fails if the fastest import is slower than the
+budget or if a heavy dependency is imported before it is needed.
+
+Usage: python benchmarks/bench_import.py [--budget 0.25] [--runs 5]
+"""
+from pathlib import Path
+import argparse
+import json
+import subprocess
+import sys
+
+REPO_PATH: Path = Path(__file__).resolve().parent.parent
+
+# Modules imported on start up, by both the GUI and the command line
+MODULES: list = ["src.helper", "src.library", "src.scheme", "src.show", "src.playlist", "src.probe", "src.markers",
+                 "src.cli"]
+
+# Dependencies that should only be imported once they are first used
+HEAVY_MODULES: list = ["pandas", "numpy", "tinytag", "PySimpleGUI"]
+
+IMPORT_SCRIPT: str = """
+import json, sys, time
+start = time.perf_counter()
+for module in {modules!r}:
+    __import__(module)
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "heavy": [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+
+def measure(runs: int) -> list:
+    """
+    Times the imports in a new interpreter for each run, so that nothing is already cached in sys.modules.
+    :param runs: Number of interpreters to start
+    :return: List of results, each with the import time in seconds and any heavy modules that were imported
+    """
+    script: str = IMPORT_SCRIPT.format(modules=MODULES, heavy=HEAVY_MODULES)
+    results: list = []
+
+    for _ in range(runs):
+        output: str = subprocess.check_output([sys.executable, "-c", script], cwd=REPO_PATH.as_posix())
+        results.append(json.loads(output))
+
+    return results
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--budget", type=float, default=0.25, help="Maximum import time in seconds")
+    parser.add_argument("--runs", type=int, default=5, help="Number of cold starts to time")
+    args = parser.parse_args(argv)
+
+    results: list = measure(args.runs)
+    fastest: float = min(result["seconds"] for result in results)
+    heavy: list = sorted({name for result in results for name in result["heavy"]})
+
+    print(json.dumps({"benchmark": "import", "modules": MODULES, "runs": args.runs, "fastest_seconds": fastest,
+                      "budget_seconds": args.budget, "heavy_modules_imported": heavy}, indent=2))
+
+    if heavy:
+        print(f"FAIL: heavy modules imported on start up: {', '.join(heavy)}", file=sys.stderr)
+        return 1
+
+    if fastest > args.budget:
+        print(f"FAIL: cold start took {fastest:.3f}s, over the {args.budget:.3f}s budget", file=sys.stderr)
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""
+Traversal and generation benchmarks against a synthetic library.
+
+Builds a library of stub videos in a temporary folder, times the main traversal and generation functions, and prints
+the results as JSON so that runs can be compared.
+
+Usage: python benchmarks/bench_library.py [--shows 50] [--seasons 3] [--episodes 10] [--repeat 5] [--output out.json]
+"""
+from pathlib import Path
+import argparse
+import json
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+REPO_PATH: Path = Path(__file__).resolve().parent.parent
+sys.path.insert(0, REPO_PATH.as_posix())
+
+from benchmarks.synthetic_library import add_arguments, build_library
+from src.helper import PathManager
+from src.library import Library
+from src.playlist import Playlist
+from src.scheme import Scheme
+from src.show import Show
+
+
+def timed(function, repeat: int) -> dict:
+    """
+    Calls a function several times and summarises how long each call took.
+    :param function: Function to call with no arguments
+    :param repeat: Number of calls
+    :return: Dictionary of timings in seconds
+    """
+    times: list = []
+    for _ in range(repeat):
+        start: float = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    return summarise(times)
+
+
+def summarise(times: list) -> dict:
+    return {"runs": len(times), "min": min(times), "median": statistics.median(times), "mean": statistics.mean(times),
+            "max": max(times)}
+
+
+def get_shows_function():
+    """
+    Returns Interface.get_shows, or the library query behind it if PySimpleGUI is not installed.
+    """
+    try:
+        from src.gui import Interface
+        return "Interface.get_shows", lambda: Interface.get_shows(PathManager.TV_PATH)
+    except ImportError:
+        return "Library.shows", lambda: Library.get_library().shows()
+
+
+def run_benchmarks(args: argparse.Namespace, tv_path: Path) -> dict:
+    library_summary: dict = build_library(tv_path, args.shows, args.seasons, args.episodes, args.empty_folders,
+                                          args.odd_names, args.loose_files, args.seed)
+    PathManager.TV_PATH = tv_path
+    show_paths: list = [tv_path.joinpath(name) for name in library_summary["shows"]]
+    results: dict = {}
+
+    # The first open lists every folder. Later rescans only stat folders to look for changes
+    results["Library.scan"] = timed(lambda: Library.get_library(tv_path), 1)
+    results["Library.rescan"] = timed(lambda: Library.get_library(tv_path, rescan=True), args.repeat)
+    Library.get_library(tv_path).listings.reset_stats()
+
+    def current_episodes():
+        for show_path in show_paths:
+            Show(show_path).get_current_episode(show_path)
+
+    results["Show.get_current_episode"] = timed(current_episodes, args.repeat)
+
+    shows: list = [Show(show_path) for show_path in show_paths]
+
+    def next_episodes():
+        for show in shows:
+            for _ in range(args.steps):
+                show.find_next_episode()
+
+    results["Show.find_next_episode"] = timed(next_episodes, args.repeat)
+
+    scheme: Scheme = Scheme.new_playlist_scheme("benchmark")
+    playlist: Playlist = Playlist(args.minutes)
+
+    def generate():
+        playlist.clear_playlist()
+        playlist.generate_playlist(scheme, seed=args.seed)
+
+    results["Playlist.generate_playlist"] = timed(generate, args.repeat)
+    results["Playlist.generate_playlist"]["episodes"] = len(playlist.video_queue)
+
+    name, get_shows = get_shows_function()
+    results[name] = timed(get_shows, args.repeat)
+
+    # Commit a playlist with .eps files mirrored, so that there are markers to clear
+    def clear_markers():
+        PathManager.MIRROR_EPS_FILES = True
+        for show in shows:
+            show.write_episode_markers(show.current_episode)
+        PathManager.MIRROR_EPS_FILES = False
+
+        start: float = time.perf_counter()
+        Show.clear_episode_files(tv_path)
+        return time.perf_counter() - start
+
+    results["Show.clear_episode_files"] = summarise([clear_markers() for _ in range(args.repeat)])
+    results["listing_cache"] = Library.get_library(tv_path).listings.stats()
+
+    return {"library": {"shows": len(show_paths), "files": library_summary["files"], "seasons": args.seasons,
+                        "episodes": args.episodes, "empty_folders": args.empty_folders,
+                        "loose_files": args.loose_files, "odd_names": args.odd_names},
+            "results": results}
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument("--repeat", type=int, default=5, help="Number of times to run each benchmark")
+    parser.add_argument("--steps", type=int, default=20, help="Episodes to step through per show")
+    parser.add_argument("--minutes", type=int, default=600, help="Length of the generated playlist")
+    parser.add_argument("--output", type=Path, help="Write the results to a JSON file as well as printing them")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="vlc_rand_bench_") as folder:
+        report: dict = run_benchmarks(args, Path(folder).joinpath("TV"))
+        Library.get_library(Path(folder).joinpath("TV")).close()
+
+    report["python"] = platform.python_version()
+    report["platform"] = platform.platform()
+
+    output: str = json.dumps(report, indent=2)
+    print(output)
+
+    if args.output:
+        args.output.write_text(output)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""
+Natural sort benchmark, comparing NaturalSort with Show.human_sort.
+
+Sorts folders of synthetic episode names the way a library scan does, with both implementations, and fails if
+NaturalSort orders any folder differently. NaturalSort is timed with a cold cache, then again with the keys already
+memoized, as when folders are listed again.
+
+Usage: python benchmarks/bench_sort.py [--folders 200] [--names 50] [--repeat 5] [--seed 0]
+"""
+from pathlib import Path
+import argparse
+import json
+import random
+import sys
+
+REPO_PATH: Path = Path(__file__).resolve().parent.parent
+sys.path.insert(0, REPO_PATH.as_posix())
+
+from benchmarks.bench_library import timed
+from benchmarks.synthetic_library import EPISODE_FORMATS, ODD_EPISODE_FORMATS, ODD_NAMES
+from src.natsort import NaturalSort
+from src.show import Show
+
+# Names found alongside episodes, including names made only of digits from other scripts, which are never numbers
+# when they start a name
+EXTRA_NAMES: list = ["Extras", "\u0663", "\u0663\u0664", "\u0967 Special"]
+
+
+def build_folders(folders: int, names: int, seed: int) -> list:
+    """
+    Creates lists of episode names, each in one of the synthetic library's formats, with the names in random order.
+    :return: List of (folder path, list of names)
+    """
+    generator = random.Random(seed)
+    formats: list = EPISODE_FORMATS + ODD_EPISODE_FORMATS
+    shows: list = ODD_NAMES + [f"Show {number}" for number in range(1, 11)]
+    result: list = []
+
+    for folder in range(folders):
+        show: str = generator.choice(shows).strip()
+        season: int = generator.randint(1, 12)
+        episode_format: str = generator.choice(formats)
+
+        folder_names: list = [episode_format.format(show=show, season=season, episode=episode)
+                              for episode in range(1, names + 1)] + EXTRA_NAMES + [f"Special {season}.mkv"]
+        generator.shuffle(folder_names)
+        result.append((Path("/TV", show, f"Season {season}"), folder_names))
+
+    return result
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--folders", type=int, default=200, help="Number of folders to sort")
+    parser.add_argument("--names", type=int, default=50, help="Episodes per folder")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of times to run each benchmark")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the names and their order")
+    args = parser.parse_args(argv)
+
+    folders: list = build_folders(args.folders, args.names, args.seed)
+    folder_paths: list = [[folder.joinpath(name) for name in names] for folder, names in folders]
+
+    def human_sort():
+        for paths in folder_paths:
+            Show.human_sort(list(paths))
+
+    def natural_sort():
+        for folder, names in folders:
+            NaturalSort.sort(names)
+
+    def natural_sort_cold():
+        NaturalSort.clear_cache()
+        natural_sort()
+
+    results: dict = {"Show.human_sort": timed(human_sort, args.repeat),
+                     "NaturalSort.sort (cold)": timed(natural_sort_cold, args.repeat),
+                     "NaturalSort.sort (cached)": timed(natural_sort, args.repeat)}
+
+    # Both sort the same names, so the orders can be compared name by name
+    mismatched: list = []
+    for folder, names in folders:
+        paths: list = [folder.joinpath(name) for name in names]
+        Show.human_sort(paths)
+
+        if [path.name for path in paths] != NaturalSort.sort(names):
+            mismatched.append(folder.as_posix())
+
+    print(json.dumps({"benchmark": "sort", "folders": args.folders,
+                      "names_per_folder": args.names + len(EXTRA_NAMES) + 1,
+                      "results": results, "cache": NaturalSort.cache_info(), "mismatched_folders": mismatched},
+                     indent=2))
+
+    if mismatched:
+        print(f"FAIL: NaturalSort ordered {len(mismatched)} folders differently to Show.human_sort", file=sys.stderr)
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
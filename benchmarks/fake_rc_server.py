@@ -0,0 +1,167 @@
+"""
+Fake VLC RC interface, for exercising PlayerController without VLC.
+
+Accepts add, enqueue, status and shutdown over TCP, and moves on to the next enqueued item every few seconds as if
+each one had finished playing. Run on its own to play a playlist from a synthetic library through a PlayerController
+and print the markers it recorded. Fails if the controller played episodes out of order, enqueued more than
+--lookahead episodes beyond the one playing, or left a show's marker anywhere but on the last episode it played.
+
+Usage: python benchmarks/fake_rc_server.py [--shows 5] [--episode-seconds 0.5] [--lookahead 3]
+                                           [--advance-on start|finish]
+"""
+from pathlib import Path
+import argparse
+import json
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+REPO_PATH: Path = Path(__file__).resolve().parent.parent
+sys.path.insert(0, REPO_PATH.as_posix())
+
+from benchmarks.synthetic_library import add_arguments, build_library
+from src.helper import PathManager
+from src.library import Library
+from src.markers import MarkerStore
+from src.player import PlayerController
+from src.playlist import Playlist
+from src.scheme import Scheme
+
+GREETING: str = "VLC media player 3.0.18 Vetinari\r\nCommand Line Interface initialized. Type `help' for help.\r\n> "
+
+
+class FakeRCServer:
+    def __init__(self, episode_seconds: float = 0.5, host: str = "127.0.0.1", port: int = 0):
+        self.episode_seconds: float = episode_seconds
+        # socket.create_server is only available from Python 3.8
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((host, port))
+        self.server.listen(1)
+        self.port: int = self.server.getsockname()[1]
+
+        # Items added over the connection, the one playing, and when it started
+        self.items: list = []
+        self.index: int = None
+        self.started: float = 0
+        self.commands: list = []
+
+        # Most items ever enqueued beyond the one playing
+        self.max_ahead: int = 0
+
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def serve(self):
+        client, _ = self.server.accept()
+
+        with client, client.makefile("r", encoding="utf-8") as lines:
+            client.sendall(GREETING.encode("utf-8"))
+
+            for line in lines:
+                command, _, argument = line.strip().partition(" ")
+                self.commands.append(command)
+
+                if command in ["shutdown", "quit"]:
+                    break
+
+                client.sendall((self.respond(command, argument) + "> ").encode("utf-8"))
+
+        self.server.close()
+
+    def respond(self, command: str, argument: str) -> str:
+        if command == "add":
+            self.items.append(argument)
+            self.index = len(self.items) - 1
+            self.started = time.monotonic()
+        elif command == "enqueue":
+            self.items.append(argument)
+        elif command == "status":
+            return self.status()
+
+        if self.index is not None:
+            self.max_ahead = max(self.max_ahead, len(self.items) - 1 - self.index)
+
+        return ""
+
+    def status(self) -> str:
+        # Move on past every item that would have finished by now
+        if self.index is not None:
+            finished: int = int((time.monotonic() - self.started) / self.episode_seconds)
+            if finished:
+                self.index += finished
+                self.started += finished * self.episode_seconds
+
+            if self.index >= len(self.items):
+                self.index = None
+
+        if self.index is None:
+            return "( audio volume: 256 )\r\n( state stopped )\r\n"
+
+        return f"( new input: {self.items[self.index]} )\r\n( audio volume: 256 )\r\n( state playing )\r\n"
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument("--minutes", type=int, default=200, help="Length of the playlist")
+    parser.add_argument("--episode-seconds", type=float, default=0.5, help="Seconds each item plays for")
+    parser.add_argument("--lookahead", type=int, default=PlayerController.LOOKAHEAD,
+                        help="Episodes to keep enqueued beyond the one playing")
+    parser.add_argument("--advance-on", choices=[PlayerController.START, PlayerController.FINISH],
+                        default=PlayerController.START)
+    parser.set_defaults(shows=5, seasons=2, episodes=4)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="vlc_rand_rc_") as folder:
+        tv_path: Path = Path(folder).joinpath("TV")
+        build_library(tv_path, args.shows, args.seasons, args.episodes, args.empty_folders, args.odd_names,
+                      args.loose_files, args.seed)
+        PathManager.TV_PATH = tv_path
+
+        playlist = Playlist(args.minutes)
+        playlist.generate_playlist(Scheme.new_playlist_scheme("fake"), seed=args.seed)
+        queued: int = len(playlist.video_queue)
+
+        server = FakeRCServer(args.episode_seconds).start()
+        queue: list = list(playlist.video_queue)
+        controller = PlayerController.from_playlist(playlist, lookahead=args.lookahead, advance_on=args.advance_on,
+                                                    port=server.port)
+        controller.POLL_INTERVAL = args.episode_seconds / 5
+        controller.connect()
+        played: list = controller.run()
+
+        library: Library = Library.get_library()
+        store: MarkerStore = MarkerStore.get_store(library)
+        markers: dict = {show.name: store.get(show).relative_to(show).as_posix()
+                         for show in library.shows() if store.get(show)}
+
+        # Each show's marker should be on the last of its episodes that played
+        last_played: dict = {library.show_path(episode).name: episode.relative_to(library.show_path(episode)).as_posix()
+                             for episode in played}
+        library.close()
+
+    failures: list = []
+    if played != queue:
+        failures.append(f"Played {len(played)} of {queued} episodes, or out of order")
+    if server.max_ahead > args.lookahead:
+        failures.append(f"Enqueued {server.max_ahead} episodes ahead, with a lookahead of {args.lookahead}")
+    if markers != last_played:
+        failures.append("Markers are not on the last episode played of each show")
+
+    print(json.dumps({"queued": queued, "played": len(played), "commands": len(server.commands),
+                      "max_ahead": server.max_ahead, "markers": markers, "failures": failures}, indent=2))
+
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""
+Builds synthetic TV libraries for benchmarking, with tiny stub files in place of real videos.
+
+Usage: python benchmarks/synthetic_library.py <path> [--shows 50] [--seasons 3] [--episodes 10] [--empty-folders 1]
+                                                     [--odd-names] [--loose-files 2] [--seed 0]
+"""
+from pathlib import Path
+import argparse
+import random
+import sys
+
+# Names that stress human sorting and path handling
+ODD_NAMES: list = ["The Show (2005) [1080p]", "show 100% Real", "Ünïcödé Show", "show_with_underscores",
+                   "10 Things", "Mr. Robot", "  Spaced  Out", "UPPER lower MiXeD", "S.H.I.E.L.D", "24"]
+EPISODE_FORMATS: list = ["{show} - S{season:02d}E{episode:02d}.mkv", "{show} {season}x{episode:02d}.mp4",
+                         "Episode {episode}.avi", "{episode:03d} - Part {episode}.mkv"]
+ODD_EPISODE_FORMATS: list = ["{show}.S{season:02d}E{episode:02d}.720p.mkv", "ep{episode} (final cut).mp4",
+                             "{season}-{episode}.webm", "Épisode {episode}.mkv"]
+STUB: bytes = b"\x00" * 16
+
+
+def build_library(root: Path, shows: int = 50, seasons: int = 3, episodes: int = 10, empty_folders: int = 1,
+                  odd_names: bool = False, loose_files: int = 2, seed: int = 0) -> dict:
+    """
+    Creates a library of shows, each with season folders of stub episodes.
+    :param root: Folder to create the library in. Used as TV_PATH
+    :param shows: Number of show folders
+    :param seasons: Season folders per show. Shows with one season have their episodes in the show folder
+    :param episodes: Episodes per season
+    :param empty_folders: Empty extras folders per show
+    :param odd_names: Use unusual show and episode names to exercise sorting and escaping
+    :param loose_files: Videos directly in the show folder, beside the season folders
+    :param seed: Seed for choosing names, so the same arguments always build the same library
+    :return: Summary of what was created
+    """
+    generator = random.Random(seed)
+    root.mkdir(parents=True, exist_ok=True)
+    root.joinpath(".scheme").mkdir(exist_ok=True)
+
+    formats: list = EPISODE_FORMATS + (ODD_EPISODE_FORMATS if odd_names else [])
+    show_names: list = []
+    file_count: int = 0
+
+    for show_number in range(shows):
+        if odd_names and show_number < len(ODD_NAMES):
+            name: str = ODD_NAMES[show_number]
+        else:
+            name: str = f"Show {show_number + 1}"
+
+        show_path: Path = root.joinpath(name)
+        show_path.mkdir(exist_ok=True)
+        show_names.append(name)
+        episode_format: str = generator.choice(formats)
+
+        for season in range(1, seasons + 1):
+            season_path: Path = show_path if seasons == 1 else show_path.joinpath(f"Season {season}")
+            season_path.mkdir(exist_ok=True)
+
+            for episode in range(1, episodes + 1):
+                season_path.joinpath(episode_format.format(show=name.strip(), season=season, episode=episode)
+                                     ).write_bytes(STUB)
+                file_count += 1
+
+        for folder in range(empty_folders):
+            show_path.joinpath(f"Extras {folder + 1}").mkdir(exist_ok=True)
+
+        for loose_file in range(loose_files):
+            show_path.joinpath(f"Special {loose_file + 1}.mkv").write_bytes(STUB)
+            file_count += 1
+
+    return {"root": root.as_posix(), "shows": show_names, "files": file_count}
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("path", type=Path, help="Folder to create the library in")
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    summary: dict = build_library(args.path, args.shows, args.seasons, args.episodes, args.empty_folders,
+                                  args.odd_names, args.loose_files, args.seed)
+    print(f"Created {len(summary['shows'])} shows and {summary['files']} episodes in {summary['root']}")
+    return 0
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """
+    Adds the library shape options, so that benchmarks can share them.
+    """
+    parser.add_argument("--shows", type=int, default=50, help="Number of shows")
+    parser.add_argument("--seasons", type=int, default=3, help="Season folders per show")
+    parser.add_argument("--episodes", type=int, default=10, help="Episodes per season")
+    parser.add_argument("--empty-folders", type=int, default=1, help="Empty folders per show")
+    parser.add_argument("--loose-files", type=int, default=2, help="Videos in the root of each show folder")
+    parser.add_argument("--odd-names", action="store_true", help="Use unusual show and episode names")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for names and playlist generation")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
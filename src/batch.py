@@ -0,0 +1,184 @@
+# Generates several playlists in one pass, such as a week of playlists for several rooms
+from src.duration import DurationCache
+from src.helper import PathManager
+from src.library import Library
+from src.markers import MarkerStore
+from src.playlist import Playlist
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import multiprocessing
+import os
+
+
+class PlaylistBatch:
+    """
+    Generates a number of playlists from each of several schemes. Each show carries on from where it left off in the
+    previous playlist of the batch, as if every playlist had been played in turn, so no episode is repeated until a
+    show wraps around.
+    Schemes that share a show have to be generated one after the other, so they are grouped together. Independent
+    groups are generated in separate processes, which all read the same library index and duration cache. Only this
+    process writes to the index: durations probed by the workers are passed back and stored in one transaction.
+    """
+    # --------------------- Class Variables -----------------------------
+    WORKERS: int = os.cpu_count() or 1
+
+    def __init__(self, schemes: list, count: int = 1, max_length: int = 200, seed: int = None,
+                 workers: int = WORKERS, rescan: bool = True):
+        """
+        :param schemes: Schemes to generate playlists from
+        :param count: Number of playlists to generate from each scheme
+        :param max_length: Maximum duration of each playlist in minutes
+        :param seed: Optional seed, so that a batch can be reproduced. Each playlist is seeded with the seed plus its
+                     position in the batch
+        :param workers: Maximum number of processes. 1 generates every playlist in this process
+        :param rescan: Bring the library index up to date before generating. Otherwise the index is used as stored
+        """
+        self.schemes: list = schemes
+        self.count: int = count
+        self.max_length: int = max_length
+        self.seed: int = seed
+        self.workers: int = workers
+        self.rescan: bool = rescan
+
+        # Generated playlists, in the order they would be played: the first playlist of every scheme, then the second
+        self.playlists: list = []
+
+    # --------------------- Generation ----------------------------
+    def generate(self) -> list:
+        """
+        Generates every playlist in the batch. Markers are not changed until commit_markers is called.
+        :return: List of (scheme title, playlist number from 1, Playlist)
+        """
+        # Bring the index up to date once, so that every process works from the same snapshot of the library. The
+        # duration cache and marker store create their tables here, since the workers open the index read only
+        library: Library = Library.get_library(rescan=self.rescan)
+        cache: DurationCache = DurationCache.get_cache(library)
+        MarkerStore.get_store(library)
+
+        groups: list = self.group_schemes()
+        jobs: list = [[(position, scheme) for position, scheme in enumerate(self.schemes) if scheme in group]
+                      for group in groups]
+        width: int = len(self.schemes)
+
+        if self.workers <= 1 or len(jobs) <= 1:
+            results: list = [self.generate_group(job, self.count, self.max_length, self.seed, width) for job in jobs]
+        else:
+            # Processes are spawned rather than forked, so that none inherits this process's database connections
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(jobs)),
+                                     mp_context=multiprocessing.get_context("spawn"),
+                                     initializer=self.init_worker,
+                                     initargs=(PathManager.TV_PATH, PathManager.ESTIMATE_DURATIONS)) as executor:
+                results: list = []
+                for result, probed, used in executor.map(self.generate_in_worker, jobs, [self.count] * len(jobs),
+                                                         [self.max_length] * len(jobs), [self.seed] * len(jobs),
+                                                         [width] * len(jobs)):
+                    results.append(result)
+                    cache.store_durations(probed, used)
+
+        # Put the playlists back in batch order, regardless of which group they were generated in
+        playlists: list = sorted(playlist for result in results for playlist in result)
+        self.playlists = [(self.schemes[position].title, number + 1, playlist)
+                          for number, position, playlist in playlists]
+
+        return self.playlists
+
+    def group_schemes(self) -> list:
+        """
+        Groups schemes that share a show, directly or through another scheme.
+        :return: List of lists of schemes
+        """
+        groups: list = []
+
+        for scheme in self.schemes:
+            shows: set = set(scheme.show_paths())
+            merged: list = [scheme]
+
+            for group in [group for group in groups if group[0] & shows]:
+                groups.remove(group)
+                shows |= group[0]
+                merged += group[1]
+
+            groups.append((shows, merged))
+
+        return [group[1] for group in groups]
+
+    @staticmethod
+    def generate_group(job: list, count: int, max_length: int, seed: int = None, width: int = 1) -> list:
+        """
+        Generates the playlists of a group of schemes, carrying each show on from one playlist to the next.
+        :param job: List of (position in the batch, scheme)
+        :param width: Number of schemes in the whole batch, for seeding each playlist by its position in the batch
+        :return: List of (playlist number, position, Playlist), sortable into batch order
+        """
+        results: list = []
+        next_episode_dict: dict = {}
+
+        for number in range(count):
+            for position, scheme in job:
+                playlist = Playlist(max_length)
+                playlist.next_episode_dict = dict(next_episode_dict)
+
+                playlist_seed: int = None if seed is None else seed + number * width + position
+                playlist.generate_playlist(scheme, seed=playlist_seed)
+
+                next_episode_dict = playlist.next_episode_dict
+                results.append((number, position, playlist))
+
+        return results
+
+    @classmethod
+    def generate_in_worker(cls, job: list, count: int, max_length: int, seed: int = None, width: int = 1) -> tuple:
+        """
+        Generates a group in a worker process, returning what the read only duration cache would have written.
+        :return: Result of generate_group, and the durations probed and entries used, as from DurationCache.take_probed
+        """
+        results: list = cls.generate_group(job, count, max_length, seed, width)
+
+        cache: DurationCache = DurationCache.get_cache()
+        cache.wait_for_refinement()
+        return (results,) + cache.take_probed()
+
+    @staticmethod
+    def init_worker(tv_path: Path, estimate_durations: bool):
+        """
+        Sets up a spawned process with the same TV_PATH and settings, opening the library read only without scanning it
+        again.
+        """
+        PathManager.TV_PATH = tv_path
+        PathManager.ESTIMATE_DURATIONS = estimate_durations
+        Library.attach(tv_path, read_only=True)
+
+    # --------------------- Results ----------------------------
+    def commit_markers(self) -> int:
+        """
+        Advances the markers to the end of the batch, as if every playlist had been loaded into VLC in turn. This
+        empties the playlists, so export them first.
+        :return: Number of shows whose markers were written
+        """
+        for title, number, playlist in self.playlists:
+            while playlist.video_queue:
+                playlist.dequeue_playlist()
+
+        return Playlist.commit_markers()
+
+    def export_playlists(self, folder: Path, extension: str = ".xspf") -> list:
+        """
+        Writes each playlist to a file named after its scheme and number, such as Lounge_03.xspf.
+        :param folder: Folder to write the playlists to. Created if it does not exist
+        :param extension: .xspf, .m3u8 or .m3u
+        :return: Paths of the files written
+        """
+        folder.mkdir(parents=True, exist_ok=True)
+        paths: list = []
+
+        for title, number, playlist in self.playlists:
+            path: Path = folder.joinpath(f"{title}_{number:02d}{extension}")
+            playlist.export_playlist(path)
+            paths.append(path)
+
+        return paths
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,291 @@
+# Command line interface for generating playlists and managing episode markers without the GUI
+from src.batch import PlaylistBatch
+from src.helper import PathManager
+from src.library import Library
+from src.player import PlayerController
+from src.playlist import Playlist
+from src.profiler import Profiler
+from src.scheme import Scheme
+from src.show import Show
+
+from pathlib import Path
+import argparse
+import json
+import sqlite3
+import sys
+
+
+class CommandLine:
+    def __init__(self, args: argparse.Namespace):
+        self.args: argparse.Namespace = args
+
+    # --------------------- Parser ----------------------------
+    @staticmethod
+    def parser() -> argparse.ArgumentParser:
+        parser = argparse.ArgumentParser(prog="vlc_randomizer_cli",
+                                         description="Generate playlists and manage episode markers without the GUI.")
+        parser.add_argument("--tv-path", type=Path, help="TV/Movie directory. Defaults to the saved TV_PATH")
+        parser.add_argument("--vlc-path", type=Path, help="VLC executable. Defaults to the saved VLC_PATH")
+        parser.add_argument("--save-paths", action="store_true", help="Save the paths for future runs")
+        parser.add_argument("--profile", action="store_true",
+                            help="Print the filesystem operations and time spent in each phase to stderr as JSON")
+        parser.add_argument("--rescan", action="store_true",
+                            help="Update the library index before running the command, rather than using it as stored")
+
+        commands = parser.add_subparsers(dest="command", metavar="command")
+        commands.required = True
+
+        generate = commands.add_parser("generate", help="Generate a playlist from a scheme")
+        generate.add_argument("scheme", help="Name of the scheme in TV_PATH/.scheme")
+        generate.add_argument("--minutes", type=int, default=200, help="Maximum duration of the playlist")
+        generate.add_argument("--seed", type=int, help="Seed, to reproduce a playlist")
+        generate.add_argument("--output", type=Path,
+                              help="Write the playlist to a file. The format is chosen by extension: .m3u8 or .xspf")
+        generate.add_argument("--commit", action="store_true",
+                              help="Advance the episode markers, as if the playlist had been loaded into VLC")
+        generate.add_argument("--estimate", action="store_true",
+                              help="Estimate durations from file sizes, probing the videos in the background")
+
+        batch = commands.add_parser("batch", help="Generate several playlists from one or more schemes in one pass")
+        batch.add_argument("schemes", nargs="+", help="Names of the schemes in TV_PATH/.scheme")
+        batch.add_argument("--count", type=int, default=1, help="Number of playlists to generate from each scheme")
+        batch.add_argument("--minutes", type=int, default=200, help="Maximum duration of each playlist")
+        batch.add_argument("--seed", type=int, help="Seed, to reproduce a batch")
+        batch.add_argument("--output-dir", type=Path,
+                           help="Write each playlist to a file in this folder, named after its scheme and number")
+        batch.add_argument("--format", choices=["xspf", "m3u8", "m3u"], default="xspf",
+                           help="Format of the files written to --output-dir")
+        batch.add_argument("--workers", type=int, default=PlaylistBatch.WORKERS,
+                           help="Processes to spread independent schemes across")
+        batch.add_argument("--commit", action="store_true",
+                           help="Advance the episode markers to the end of the batch")
+        batch.add_argument("--estimate", action="store_true",
+                           help="Estimate durations from file sizes, probing the videos in the background")
+
+        play = commands.add_parser("play", help="Play a scheme in VLC, marking episodes as they play")
+        play.add_argument("scheme", help="Name of the scheme in TV_PATH/.scheme")
+        play.add_argument("--minutes", type=int, default=200, help="Maximum duration of the playlist")
+        play.add_argument("--channel", action="store_true", help="Keep picking episodes until VLC is closed")
+        play.add_argument("--seed", type=int, help="Seed, to reproduce a playlist")
+        play.add_argument("--lookahead", type=int, default=PlayerController.LOOKAHEAD,
+                          help="Episodes to keep enqueued in VLC beyond the one playing")
+        play.add_argument("--advance-on", choices=[PlayerController.START, PlayerController.FINISH],
+                          default=PlayerController.START, help="Mark an episode when it starts or when it finishes")
+        play.add_argument("--rc-port", type=int, default=PlayerController.RC_PORT, help="Port for VLC's RC interface")
+        play.add_argument("--estimate", action="store_true",
+                          help="Estimate durations from file sizes, probing the videos in the background")
+
+        commands.add_parser("schemes", help="List the schemes in TV_PATH/.scheme")
+        commands.add_parser("shows", help="List the shows in TV_PATH")
+        commands.add_parser("rescan", help="Update the library index with any changes in TV_PATH")
+
+        markers = commands.add_parser("markers", help="Show the current episode of each show")
+        markers.add_argument("shows", nargs="*", help="Shows to list. Defaults to every show")
+
+        advance = commands.add_parser("advance", help="Move a show's marker forward")
+        advance.add_argument("show", help="Show folder name")
+        advance.add_argument("--count", type=int, default=1, help="Number of episodes to move forward")
+
+        set_marker = commands.add_parser("set", help="Set a show's marker to an episode")
+        set_marker.add_argument("show", help="Show folder name")
+        set_marker.add_argument("episode", type=Path, help="Path of the episode, absolute or relative to the show")
+
+        reset = commands.add_parser("reset", help="Reset markers so shows start from their first episode")
+        reset.add_argument("shows", nargs="*", help="Shows to reset. Defaults to every show")
+        reset.add_argument("--scheme", help="Reset the shows in a scheme, as well as any shows listed")
+
+        return parser
+
+    @classmethod
+    def main(cls, argv: list = None) -> int:
+        """
+        Parses the arguments and runs the selected command.
+        :param argv: Command line arguments. Defaults to sys.argv
+        :return: Exit code
+        """
+        args = cls.parser().parse_args(argv)
+
+        PathManager.load_paths()
+        if args.tv_path:
+            PathManager.TV_PATH = args.tv_path
+        if args.vlc_path:
+            PathManager.VLC_PATH = args.vlc_path
+        PathManager.set_vlc_path()
+
+        if not PathManager.TV_PATH or not PathManager.TV_PATH.is_dir():
+            print(f"Invalid TV path: {PathManager.TV_PATH}. Set one with --tv-path.", file=sys.stderr)
+            return 2
+
+        if args.save_paths:
+            PathManager.save_paths()
+
+        Profiler.enable(args.profile)
+
+        with Profiler.session() as profiler:
+            try:
+                # Work from the stored index, so that commands start without walking the library. It is only walked
+                # with --rescan, by the rescan command, or if it has never been scanned
+                library: Library = Library.attach(PathManager.TV_PATH)
+                if args.command != "rescan" and (args.rescan or not library.indexed):
+                    library.rescan()
+
+                return getattr(cls(args), args.command)() or 0
+            # OSError includes missing files, VLC connection errors and failures writing .eps files
+            except (ValueError, OSError, sqlite3.Error) as err:
+                print(err, file=sys.stderr)
+                return 1
+            finally:
+                if profiler:
+                    print(json.dumps(profiler.report(), indent=2), file=sys.stderr)
+
+    # --------------------- Commands ----------------------------
+    def generate(self):
+        if self.args.scheme not in self.get_schemes():
+            raise FileNotFoundError(f"Scheme not found: {self.args.scheme}")
+
+        playlist = Playlist(self.args.minutes)
+        playlist.estimate_durations |= self.args.estimate
+        report = playlist.generate_playlist(Scheme.load_playlist_scheme(self.args.scheme), seed=self.args.seed)
+
+        for show, reason in report.skipped_shows.items():
+            print(f"Skipped {show}: {reason}", file=sys.stderr)
+
+        if self.args.output:
+            playlist.export_playlist(self.args.output)
+        else:
+            for video in playlist.video_queue:
+                print(video.as_posix())
+
+        if self.args.commit:
+            while playlist.video_queue:
+                playlist.dequeue_playlist()
+            playlist.commit_markers()
+
+    def batch(self):
+        for name in self.args.schemes:
+            if name not in self.get_schemes():
+                raise FileNotFoundError(f"Scheme not found: {name}")
+
+        PathManager.ESTIMATE_DURATIONS |= self.args.estimate
+        batch = PlaylistBatch([Scheme.load_playlist_scheme(name) for name in self.args.schemes], self.args.count,
+                              self.args.minutes, self.args.seed, self.args.workers, rescan=False)
+
+        # Shows are skipped for the same reason in every playlist of a scheme, so they are only reported once
+        for title, number, playlist in batch.generate():
+            for show, reason in playlist.report.skipped_shows.items() if number == 1 else []:
+                print(f"Skipped {show} in {title}: {reason}", file=sys.stderr)
+
+        if self.args.output_dir:
+            for path in batch.export_playlists(self.args.output_dir, "." + self.args.format):
+                print(path.as_posix())
+        else:
+            for title, number, playlist in batch.playlists:
+                print(f"# {title} {number}")
+                for video in playlist.video_queue:
+                    print(video.as_posix())
+
+        if self.args.commit:
+            batch.commit_markers()
+
+    def play(self):
+        if self.args.scheme not in self.get_schemes():
+            raise FileNotFoundError(f"Scheme not found: {self.args.scheme}")
+
+        scheme: Scheme = Scheme.load_playlist_scheme(self.args.scheme)
+        playlist = Playlist(self.args.minutes)
+        playlist.estimate_durations |= self.args.estimate
+
+        # A channel resolves each episode only as VLC needs it, for as long as VLC stays open
+        if self.args.channel:
+            episodes = (episode for episode, duration in playlist.stream_playlist(scheme, seed=self.args.seed))
+        else:
+            playlist.generate_playlist(scheme, seed=self.args.seed)
+            episodes = playlist.video_queue
+
+        controller = PlayerController(episodes, self.args.lookahead, self.args.advance_on, port=self.args.rc_port)
+        controller.launch()
+
+        for episode in controller.run():
+            print(episode.as_posix())
+
+        for err in controller.errors:
+            print(f"Unable to save marker: {err}", file=sys.stderr)
+
+    def schemes(self):
+        for scheme in self.get_schemes():
+            print(scheme)
+
+    def shows(self):
+        for show in Library.get_library().shows():
+            print(show.name)
+
+    def rescan(self):
+        Library.get_library(rescan=True)
+
+    def markers(self):
+        for show_path in self.get_show_paths(self.args.shows):
+            episode: Path = Show(show_path).current_episode
+            print(f"{show_path.name}: {episode.relative_to(show_path).as_posix() if episode.name else '-'}")
+
+    def advance(self):
+        show = Show(self.get_show_paths([self.args.show])[0])
+
+        if show.episode_index is None:
+            raise ValueError(f"No current episode for {show.path.name}")
+
+        for _ in range(self.args.count):
+            show.find_next_episode()
+
+        show.write_episode_markers(show.current_episode)
+        print(show.current_episode.as_posix())
+
+    def set(self):
+        show = Show(self.get_show_paths([self.args.show])[0])
+        episode: Path = show.path.joinpath(self.args.episode)
+
+        if show.find_index(episode) is None:
+            raise ValueError(f"Episode not found in {show.path.name}: {self.args.episode}")
+
+        show.write_episode_markers(episode)
+
+    def reset(self):
+        show_paths: list = None
+
+        if self.args.shows or self.args.scheme:
+            show_paths = self.get_show_paths(self.args.shows) if self.args.shows else []
+
+            if self.args.scheme:
+                if self.args.scheme not in self.get_schemes():
+                    raise FileNotFoundError(f"Scheme not found: {self.args.scheme}")
+                show_paths += Scheme.load_playlist_scheme(self.args.scheme).show_paths()
+
+        removed: dict = Show.clear_episode_files(PathManager.TV_PATH, show_paths)
+        print(f"Removed {removed['markers']} markers and {removed['eps_files']} .eps files")
+
+    # --------------------- Helper Methods ----------------------------
+    @staticmethod
+    def get_schemes() -> list:
+        return [scheme.stem for scheme in PathManager.TV_PATH.joinpath(".scheme").glob("*.csv")]
+
+    @staticmethod
+    def get_show_paths(names: list) -> list:
+        """
+        Converts show folder names into paths, checking they are in the library.
+        :param names: Show folder names. If empty, every show is returned
+        :return: List of show paths
+        """
+        library: Library = Library.get_library()
+
+        if not names:
+            return library.shows()
+
+        show_paths: list = [PathManager.TV_PATH.joinpath(name) for name in names]
+        for show_path in show_paths:
+            if not library.is_directory(show_path):
+                raise ValueError(f"Show not found: {show_path.name}")
+
+        return show_paths
+
+
+if __name__ == "__main__":
+    sys.exit(CommandLine.main())
@@ -0,0 +1,359 @@
+# Persistent cache of episode durations
+from src.library import Library
+from src.probe import DurationProbe
+
+from concurrent.futures import ThreadPoolExecutor, wait
+from pathlib import Path
+
+
+class DurationCache:
+    # --------------------- Class Variables -----------------------------
+    MAX_ENTRIES: int = 50000
+
+    # A folder or show needs this many probed episodes before its bitrate is used for estimates
+    MIN_SAMPLES: int = 3
+    REFINE_WORKERS: int = DurationProbe.PARALLEL_PROBES
+
+    # Open caches, keyed by TV_PATH, sharing the connection of their library
+    _caches: dict = {}
+
+    def __init__(self, library: Library, max_entries: int = MAX_ENTRIES):
+        self.library: Library = library
+        self.max_entries: int = max_entries
+
+        # Counters for the current session, to check how effective the cache is
+        self.hits: int = 0
+        self.misses: int = 0
+        self.estimates: int = 0
+
+        # Use stamps of entries read since they were last written, keyed by index key. A hit only records its stamp
+        # here, and the stamps are written together by flush_usage, so reading the cache never writes to the index
+        self.used: dict = {}
+
+        # Durations probed while the library is read only, keyed by index key, as (size, mtime, duration). They are
+        # passed back to the process that owns the index and stored there with store_durations
+        self.probed: dict = {}
+
+        # Background probes of estimated videos, keyed by index key so that each video is only probed once
+        self.executor: ThreadPoolExecutor = None
+        self.refining: dict = {}
+
+        if not library.read_only:
+            self.create_tables()
+
+        # Most recent use stamp. Entries with the lowest stamps are evicted first
+        with self.library.lock:
+            self.clock: int = self.library.connection.execute("SELECT MAX(last_used) FROM durations").fetchone()[0] or 0
+
+    @classmethod
+    def get_cache(cls, library: Library = None):
+        """
+        Returns the shared duration cache for a library.
+        :param library: Defaults to the library for PathManager.TV_PATH
+        :return: DurationCache
+        """
+        library = library or Library.get_library()
+
+        with library.lock:
+            cache = cls._caches.get(library.tv_path)
+
+            if cache is None or cache.library is not library:
+                cache = DurationCache(library)
+                cls._caches[library.tv_path] = cache
+
+        return cache
+
+    def create_tables(self):
+        """
+        durations: Duration in minutes of each probed episode, with the size and mtime it had when probed.
+        A null duration means the file could not be read, so that it is not probed again until it changes.
+        bitrates: Total bytes and minutes of the probed episodes in each folder, each show and the whole library
+        (the ROOT key), for estimating durations from file sizes.
+        :return: None
+        """
+        with self.library.lock, self.library.connection:
+            self.library.connection.execute("CREATE TABLE IF NOT EXISTS durations "
+                                            "(path TEXT PRIMARY KEY, size INTEGER, mtime REAL, duration REAL, "
+                                            "last_used INTEGER)")
+            self.library.connection.execute("CREATE INDEX IF NOT EXISTS durations_last_used "
+                                            "ON durations (last_used)")
+            self.library.connection.execute("CREATE TABLE IF NOT EXISTS bitrates "
+                                            "(path TEXT PRIMARY KEY, bytes INTEGER, minutes REAL, samples INTEGER)")
+
+            # Durations probed before bitrates were kept are counted once
+            if not self.library.connection.execute("SELECT 1 FROM bitrates LIMIT 1").fetchone():
+                rows: list = self.library.connection.execute("SELECT path, size, duration FROM durations "
+                                                             "WHERE size > 0 AND duration > 0").fetchall()
+                for key, size, duration in rows:
+                    self.add_bitrate(key, size, duration)
+
+    # --------------------- Cache Functions ----------------------------
+    def duration(self, video: Path):
+        """
+        Returns the duration of a video in minutes, only opening the file if it has changed since it was last probed.
+        :param video: Episode to get the duration for
+        :return: Duration in minutes, or None if it could not be determined
+        """
+        try:
+            key: str = self.library.relative(video)
+        except ValueError:
+            self.misses += 1
+            return self.probe(video)
+
+        # Size and mtime come from the index, so a hit does not touch the file at all
+        file_info = self.library.file_info(video)
+
+        found, duration = self.lookup(key, file_info)
+        if found:
+            return duration
+
+        self.misses += 1
+        duration = self.probe(video)
+
+        size, mtime = file_info or (None, None)
+        with self.library.lock:
+            if self.library.read_only:
+                self.probed[key] = (size, mtime, duration)
+            else:
+                with self.library.connection:
+                    self.write_duration(key, size, mtime, duration)
+                    self.evict()
+
+        return duration
+
+    def write_duration(self, key: str, size: int, mtime: float, duration: float):
+        """
+        Stores a probed duration. Call within a transaction on the library connection.
+        :return: None
+        """
+        # Replace the old duration's contribution to the bitrates, in case the file was re-encoded
+        old = self.library.connection.execute("SELECT size, duration FROM durations WHERE path = ?",
+                                              (key,)).fetchone()
+        if old and old[0] and old[1]:
+            self.add_bitrate(key, old[0], old[1], -1)
+        if size and duration:
+            self.add_bitrate(key, size, duration)
+
+        self.library.connection.execute("INSERT OR REPLACE INTO durations VALUES (?, ?, ?, ?, ?)",
+                                        (key, size, mtime, duration, self.clock))
+        self.used.pop(key, None)
+
+    def store_durations(self, probed: dict, used: list = ()):
+        """
+        Stores durations probed by another process in a single transaction, such as those returned by take_probed.
+        :param probed: Dictionary of index key to (size, mtime, duration)
+        :param used: Index keys of entries the other process read from the cache
+        :return: None
+        """
+        with self.library.lock:
+            for key in used:
+                self.clock += 1
+                self.used[key] = self.clock
+
+            with self.library.connection:
+                for key, (size, mtime, duration) in probed.items():
+                    self.clock += 1
+                    self.write_duration(key, size, mtime, duration)
+
+                self.evict()
+
+    def take_probed(self) -> tuple:
+        """
+        Hands over what a read only cache would have written: the durations it probed and the entries it read.
+        :return: Dictionary of index key to (size, mtime, duration), and list of index keys used
+        """
+        with self.library.lock:
+            probed, used = self.probed, list(self.used)
+            self.probed, self.used = {}, {}
+
+        return probed, used
+
+    def lookup(self, key: str, file_info) -> tuple:
+        """
+        Looks up the stored duration of a video, if it was probed at its current size and mtime.
+        :return: True and the duration in minutes if it was found, otherwise False and None
+        """
+        with self.library.lock:
+            self.clock += 1
+            row = self.probed.get(key) or self.library.connection.execute(
+                "SELECT size, mtime, duration FROM durations WHERE path = ?", (key,)).fetchone()
+
+            if row and file_info and (row[0], row[1]) == tuple(file_info):
+                self.hits += 1
+                self.used[key] = self.clock
+                return True, row[2]
+
+        return False, None
+
+    # --------------------- Estimation ----------------------------
+    def estimate(self, video: Path) -> tuple:
+        """
+        Returns the duration of a video without opening it. Videos that have been probed return their stored duration,
+        and the rest are predicted from their size and the bitrate of the probed episodes in the same folder, then the
+        same show, then the whole library. Predicted videos are probed in the background, which stores their real
+        duration and corrects the bitrates for later estimates.
+        :param video: Episode to get the duration for
+        :return: Duration in minutes or None if there is nothing to estimate from, and True if it is an estimate
+        """
+        try:
+            key: str = self.library.relative(video)
+        except ValueError:
+            return self.duration(video), False
+
+        file_info = self.library.file_info(video)
+
+        found, duration = self.lookup(key, file_info)
+        if found:
+            return duration, False
+
+        self.estimates += 1
+        self.refine(video, key)
+
+        if not file_info or not file_info[0]:
+            return None, True
+
+        keys: list = self.bitrate_keys(key)
+        with self.library.lock:
+            rows: dict = {row[0]: row[1:] for row in self.library.connection.execute(
+                f"SELECT path, bytes, minutes, samples FROM bitrates WHERE path IN ({', '.join('?' * len(keys))})",
+                keys)}
+
+        for bitrate_key in keys:
+            total_bytes, minutes, samples = rows.get(bitrate_key, (0, 0, 0))
+
+            # Any probed episode is better than a fixed guess for the library as a whole
+            if total_bytes > 0 and minutes > 0 and \
+                    (samples >= self.MIN_SAMPLES or (bitrate_key == Library.ROOT and samples > 0)):
+                return file_info[0] * minutes / total_bytes, True
+
+        return None, True
+
+    def refine(self, video: Path, key: str):
+        """
+        Probes an estimated video in the background, unless it is already queued.
+        :return: None
+        """
+        with self.library.lock:
+            if key in self.refining:
+                return
+
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.REFINE_WORKERS,
+                                                   thread_name_prefix="duration_refine")
+
+            self.refining[key] = self.executor.submit(self.refine_duration, video, key)
+
+    def refine_duration(self, video: Path, key: str):
+        try:
+            return self.duration(video)
+        finally:
+            with self.library.lock:
+                self.refining.pop(key, None)
+
+    def wait_for_refinement(self, timeout: float = None) -> int:
+        """
+        Waits for background probes of estimated videos to finish.
+        :param timeout: Seconds to wait. Defaults to waiting until they are done
+        :return: Number of probes still running
+        """
+        with self.library.lock:
+            running: list = list(self.refining.values())
+
+        return len(wait(running, timeout).not_done) if running else 0
+
+    def add_bitrate(self, key: str, size: int, duration: float, sign: int = 1):
+        """
+        Adds a probed episode to the bitrates of its folder, show and library, or takes it away with a sign of -1.
+        Call within a transaction on the library connection.
+        :return: None
+        """
+        for bitrate_key in self.bitrate_keys(key):
+            self.library.connection.execute("INSERT INTO bitrates VALUES (?, ?, ?, ?) ON CONFLICT (path) DO UPDATE "
+                                            "SET bytes = bytes + excluded.bytes, minutes = minutes + excluded.minutes, "
+                                            "samples = samples + excluded.samples",
+                                            (bitrate_key, sign * size, sign * duration, sign))
+
+    @staticmethod
+    def bitrate_keys(key: str) -> list:
+        """
+        Returns the keys whose bitrates an episode counts towards, from the most to the least specific: its folder,
+        its show and the library.
+        """
+        keys: list = [key.rpartition("/")[0] or Library.ROOT, key.partition("/")[0] if "/" in key else Library.ROOT,
+                      Library.ROOT]
+        return list(dict.fromkeys(keys))
+
+    def flush_usage(self):
+        """
+        Writes the use stamps of the entries read since the last flush in a single transaction. Called at the end of
+        each generation, and before evicting so that recently read entries are kept.
+        :return: None
+        """
+        with self.library.lock:
+            # A read only cache keeps its stamps for take_probed
+            if not self.used or self.library.read_only:
+                return
+
+            with self.library.connection:
+                self.write_usage()
+
+    def write_usage(self):
+        """
+        Writes the pending use stamps. Call within a transaction on the library connection.
+        :return: None
+        """
+        self.library.connection.executemany("UPDATE durations SET last_used = ? WHERE path = ?",
+                                            [(stamp, key) for key, stamp in self.used.items()])
+        self.used.clear()
+
+    def evict(self):
+        """
+        Removes the least recently used entries once the cache grows beyond its maximum size.
+        Call within a transaction on the library connection.
+        :return: None
+        """
+        self.write_usage()
+
+        count: int = self.library.connection.execute("SELECT COUNT(*) FROM durations").fetchone()[0]
+
+        if count > self.max_entries:
+            self.library.connection.execute("DELETE FROM durations WHERE path IN "
+                                            "(SELECT path FROM durations ORDER BY last_used LIMIT ?)",
+                                            (count - self.max_entries,))
+
+    def clear(self):
+        """
+        Removes all stored durations and resets the counters.
+        :return: None
+        """
+        with self.library.lock, self.library.connection:
+            self.library.connection.execute("DELETE FROM durations")
+            self.library.connection.execute("DELETE FROM bitrates")
+            self.used.clear()
+
+        self.hits = 0
+        self.misses = 0
+        self.estimates = 0
+
+    @property
+    def stats(self) -> dict:
+        with self.library.lock:
+            size: int = self.library.connection.execute("SELECT COUNT(*) FROM durations").fetchone()[0]
+            refining: int = len(self.refining)
+
+        return {"hits": self.hits, "misses": self.misses, "estimates": self.estimates, "refining": refining,
+                "size": size, "max_entries": self.max_entries}
+
+    # -------------------- Static Methods -----------------------
+    @staticmethod
+    def probe(video: Path):
+        """
+        Reads the duration of a video from its headers, using the shared DurationProbe and its fallbacks.
+        :param video: Path to the video
+        :return: Duration in minutes, or DurationProbe.UNKNOWN (None) if it could not be read
+        """
+        return DurationProbe.get_probe().probe(video)
+
+
+if __name__ == "__main__":
+    pass
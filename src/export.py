@@ -0,0 +1,112 @@
+# Writes playlists to M3U8 and XSPF files, so they can be opened by VLC or any other player
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+
+class PlaylistWriter:
+    """
+    Writes a playlist one video at a time, so that a long queue never has to be held as a single string.
+    Use PlaylistWriter.open to pick the format from the file extension.
+    """
+    SUFFIXES: list = []
+
+    def __init__(self, path: Path):
+        self.path: Path = path
+        self.count: int = 0
+        self.file = None
+
+    @staticmethod
+    def open(path: Path):
+        """
+        Creates a writer for the format matching the file extension. Unknown extensions are written as M3U8.
+        :param path: File to write the playlist to
+        :return: PlaylistWriter
+        """
+        for writer in [XSPFWriter, M3UWriter]:
+            if path.suffix.lower() in writer.SUFFIXES:
+                return writer(path)
+
+        return M3UWriter(path)
+
+    def __enter__(self):
+        self.file = open(self.path, "w", encoding="utf-8", newline="\n")
+        self.write_header()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.write_footer()
+        self.file.close()
+
+    def add(self, video: Path, duration: float = None):
+        """
+        Appends a video to the playlist file.
+        :param video: Path to the video
+        :param duration: Duration in minutes, if known
+        :return: None
+        """
+        self.write_entry(video.absolute(), duration)
+        self.count += 1
+
+    def add_all(self, videos, durations: dict = None) -> int:
+        """
+        Appends every video from an iterable, such as a playlist's video queue.
+        :param videos: Videos to add
+        :param durations: Optional dictionary of video to duration in minutes
+        :return: Number of videos added
+        """
+        durations = durations or {}
+
+        for video in videos:
+            self.add(video, durations.get(video))
+
+        return self.count
+
+    # -------------------- Format Methods -----------------------
+    def write_header(self):
+        pass
+
+    def write_entry(self, video: Path, duration: float = None):
+        raise NotImplementedError
+
+    def write_footer(self):
+        pass
+
+
+class M3UWriter(PlaylistWriter):
+    SUFFIXES: list = [".m3u8", ".m3u"]
+
+    def write_header(self):
+        self.file.write("#EXTM3U\n")
+
+    def write_entry(self, video: Path, duration: float = None):
+        # Extended M3U uses whole seconds, with -1 for unknown durations
+        seconds: int = round(duration * 60) if duration else -1
+        self.file.write(f"#EXTINF:{seconds},{video.stem}\n{video.as_posix()}\n")
+
+
+class XSPFWriter(PlaylistWriter):
+    SUFFIXES: list = [".xspf"]
+
+    def write_header(self):
+        self.file.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                        '<playlist version="1" xmlns="http://xspf.org/ns/0/">\n'
+                        '  <trackList>\n')
+
+    def write_entry(self, video: Path, duration: float = None):
+        self.file.write("    <track>\n"
+                        f"      <location>{escape(video.as_uri())}</location>\n"
+                        f"      <title>{escape(video.stem)}</title>\n")
+
+        # XSPF durations are in milliseconds
+        if duration:
+            self.file.write(f"      <duration>{round(duration * 60000)}</duration>\n")
+
+        self.file.write("    </track>\n")
+
+    def write_footer(self):
+        self.file.write("  </trackList>\n"
+                        "</playlist>\n")
+
+
+if __name__ == "__main__":
+    pass
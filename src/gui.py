@@ -1,18 +1,39 @@
-from src.scheme import Scheme
+from src.export import PlaylistWriter
+from src.scheme import Scheme, SchemeEditor
 from src.playlist import Playlist
 from src.helper import PathManager
+from src.player import PlayerController
+from src.library import Library
+from src.profiler import Profiler
 from src.show import Show
 
 import PySimpleGUI as sg
 import subprocess
+import threading
+import time
 from pathlib import Path
 
 
 class Interface:
+    # --------------------- Class Variables -----------------------------
+    # Minimum seconds between progress events from generation, so a fast generation does not flood the event queue
+    PROGRESS_INTERVAL: float = 0.1
+
     def __init__(self):
         self.scheme: Scheme = Scheme("Blank")
         self.playlist: Playlist = Playlist()
 
+        # Playlist generation runs in a background thread. The window keeps its own list of the episodes sent to it
+        self.generation_thread: threading.Thread = None
+        self.cancel_event: threading.Event = threading.Event()
+        self.playlist_view: list = []
+
+        # Set when VLC is launched in controller mode, to be run once the window has closed
+        self.controller: PlayerController = None
+
+        # Page, filter and unsaved frequencies of the scheme being edited
+        self.scheme_editor: SchemeEditor = None
+
     # --------------------- Main Layout ----------------------------
     def main_layout(self):
         layout = [
@@ -74,17 +95,19 @@ class Interface:
         return column_layout
 
     def playlist_phase_3(self):
-        playlist = [vid.stem for vid in self.playlist.video_queue]
+        playlist = list(self.playlist_view)
 
         column_layout = [
                 [
-                    sg.Text("Playlist: ")
+                    sg.Text("Playlist: "),
+                    sg.Text("", size=(30, 1), key="-PL_STATUS-")
                 ],
                 [
                     sg.Listbox(values=playlist, size=(40, 20), horizontal_scroll=True, disabled=False, key="-VIEW_PLAYLIST-")
                 ],
                 [
-                    sg.Button("Launch VLC", enable_events=True, size=(10, 1), key="-LAUNCH_VLC-")
+                    sg.Button("Launch VLC", enable_events=True, size=(10, 1), key="-LAUNCH_VLC-"),
+                    sg.Button("Cancel", enable_events=True, size=(10, 1), disabled=True, key="-PL_CANCEL-")
                 ]
             ]
 
@@ -198,33 +221,190 @@ class Interface:
         return column_layout
 
     # ---------------------------- Object Methods --------------------------
+    # --------------------- Playlist Generation ----------------------------
+    @property
+    def generating(self) -> bool:
+        return self.generation_thread is not None and self.generation_thread.is_alive()
+
+    def start_generation(self, window: sg.Window):
+        """
+        Clears the playlist and generates a new one in a background thread, so that the window stays responsive.
+        The thread sends -PL_PROGRESS- events with the episodes picked so far, then -PL_GENERATED- with the report,
+        or -PL_FAILED- with the error.
+        :param window: Window to send events to
+        :return: None
+        """
+        self.playlist.clear_playlist()
+        self.playlist_view = []
+        self.cancel_event = threading.Event()
+
+        self.generation_thread = threading.Thread(target=self.generate_in_background,
+                                                  args=(window, self.scheme, self.cancel_event), daemon=True)
+        self.generation_thread.start()
+
+    def cancel_generation(self, wait: bool = False):
+        """
+        Asks the background generation to stop after the episode it is picking. Episodes already picked are kept.
+        :param wait: Wait for the generation to stop, such as before changing anything it reads
+        """
+        self.cancel_event.set()
+
+        if wait and self.generating:
+            self.generation_thread.join()
+
+    def generate_in_background(self, window: sg.Window, scheme: Scheme, cancel: threading.Event):
+        # Episodes are sent in batches, at most once per PROGRESS_INTERVAL
+        pending: list = []
+        last_sent: list = [time.perf_counter()]
+
+        def progress(video: Path, minutes: float):
+            pending.append(video.stem)
+
+            now: float = time.perf_counter()
+            if now - last_sent[0] >= self.PROGRESS_INTERVAL:
+                window.write_event_value("-PL_PROGRESS-", (pending.copy(), minutes))
+                pending.clear()
+                last_sent[0] = now
+
+        try:
+            report = self.playlist.generate_playlist(scheme, progress=progress, cancel=cancel)
+        except Exception as err:
+            window.write_event_value("-PL_FAILED-", err)
+            return
+
+        window.write_event_value("-PL_PROGRESS-", (pending, report.minutes))
+        window.write_event_value("-PL_GENERATED-", report)
+
+    def show_progress(self, window: sg.Window, episodes: list, minutes: float):
+        """
+        Adds newly picked episodes to the playlist view, keeping the latest in sight.
+        :param window: Window containing the playlist view
+        :param episodes: Names of the episodes picked since the last update
+        :param minutes: Length of the playlist so far
+        :return: None
+        """
+        self.playlist_view += episodes
+
+        if "-VIEW_PLAYLIST-" in window.key_dict:
+            window["-VIEW_PLAYLIST-"].update(values=self.playlist_view)
+            window["-VIEW_PLAYLIST-"].set_vscroll_position(1.0)
+            window["-PL_STATUS-"].update(f"Generating... {len(self.playlist_view)} episodes, {round(minutes)} mins")
+
+    @staticmethod
+    def show_generation_state(window: sg.Window, generating: bool, status: str):
+        """
+        Enables the cancel button while generating, and the launch button once finished.
+        """
+        if "-LAUNCH_VLC-" in window.key_dict:
+            window["-LAUNCH_VLC-"].update(disabled=generating)
+            window["-PL_CANCEL-"].update(disabled=not generating)
+            window["-PL_STATUS-"].update(status)
+
     def run_playlist(self):
         """
         Set VLC path, then loads and plays a playlist.
+        In controller mode, VLC is only started here. Episodes are fed to it, and marked, by running self.controller.
+        Writing the playlist is timed as a phase of any Profiler session the caller has started
+        :return: None
+        :raises ConnectionError: If VLC does not open its RC interface. The playlist is left as it was, so that it can
+                                 be launched again
         """
-        # Create list of videos from playlist, beginning with the path to the VLC executable.
-        vlc_process_cmd: list = [PathManager.VLC_PATH.as_posix()]
-
-        # Add videos from playlist. IMPORTANT: Paths of videos must be URI
-        while self.playlist.video_queue:
-            vlc_process_cmd.append(self.playlist.dequeue_playlist().absolute().as_uri())
+        if PathManager.CONTROL_VLC:
+            controller = PlayerController.from_playlist(self.playlist)
+            try:
+                controller.launch()
+            except ConnectionError:
+                # Don't leave a VLC running that cannot be controlled
+                controller.close()
+                if controller.process is not None and controller.process.poll() is None:
+                    controller.process.terminate()
+                raise
+
+            self.controller = controller
+            return
+
+        # Write videos from playlist to a playlist file, rather than passing each one on the command line.
+        # Dequeueing only stages each show's marker in memory
+        with Profiler.phase(Profiler.PLAYLIST_WRITE), PlaylistWriter.open(PathManager.PLAYLIST_PATH) as writer:
+            while self.playlist.video_queue:
+                video: Path = self.playlist.dequeue_playlist()
+                writer.add(video, self.playlist.video_durations.get(video))
+
+        # Create subprocess as soon as the playlist is written
+        p = subprocess.Popen([PathManager.VLC_PATH.as_posix(), PathManager.PLAYLIST_PATH.as_posix()])
+
+        # Save the markers for every show in the playlist at once, without holding up VLC. Errors are reported by
+        # finish_markers
+        self.playlist.commit_markers(background=True)
+
+    def finish_markers(self, errors: list = None):
+        """
+        Waits for markers being saved in the background, showing an error if any could not be saved.
+        :param errors: Errors already collected while saving markers, such as by the controller
+        """
+        errors: list = (errors or []) + self.playlist.wait_for_markers()
 
-        # Create subprocess
-        p = subprocess.Popen(vlc_process_cmd)
+        if errors:
+            self.error_message("Unable to save episode markers:\n" + "\n".join(str(err) for err in errors))
 
     def import_scheme(self) -> sg.Column:
         """
-        Pulls the show and associated frequency for row line in the scheme. This is sorted by index
+        Pulls the show and associated frequency for each row on the first page of the scheme, with a filter box and
+        buttons to change page. There is one row of widgets per row on a page, reused for every page and scheme, so
+        large schemes open as quickly as small ones
         :return: Column for use in scheme_layout column
         """
-        # Get shows and frequencies
-        show_data = [[sg.Text("Frequency"), sg.Text("Show/Movie")]]
-        show_data += [[sg.In(size=(10, 1), default_text=v["frequency"], enable_events=True, key=f"-SCHEME_FREQ_{k}-"),
-                      sg.Text(v["show_path"], key=f"-SCHEME_SHOW_{k}-")]
-                      for k, v in self.scheme.data.to_dict(orient="index").items()]
+        self.scheme_editor = SchemeEditor(self.scheme)
+        rows: list = self.scheme_editor.visible_rows()
+
+        show_data = [[sg.Text("Filter: "), sg.In(size=(25, 1), enable_events=True, key="-SCHEME_FILTER-")],
+                     [sg.Text("Frequency"), sg.Text("Show/Movie")]]
+
+        for slot in range(self.scheme_editor.page_size):
+            index, show_path, frequency = rows[slot] if slot < len(rows) else (None, "", "")
+            show_data.append([sg.In(size=(10, 1), default_text=frequency, disabled=index is None, enable_events=True,
+                                    key=f"-SCHEME_FREQ_{slot}-"),
+                              sg.Text(show_path, size=(30, 1), key=f"-SCHEME_SHOW_{slot}-")])
+
+        show_data.append([sg.Button("<", size=(3, 1), key="-SCHEME_PREV-"),
+                          sg.Text(self.scheme_page_text(), size=(22, 1), justification="center", key="-SCHEME_PAGE-"),
+                          sg.Button(">", size=(3, 1), key="-SCHEME_NEXT-")])
 
         # Merge into a list of list, then return as column
-        return sg.Column(show_data, size=(290, 380), scrollable=True, key=f"-SCHEME_DETAILS-{self.scheme.title.upper()}-")
+        return sg.Column(show_data, size=(290, 380), scrollable=True, key="-SCHEME_DETAILS-")
+
+    def open_scheme_editor(self, window: sg.Window):
+        """
+        Starts editing the current scheme in the existing editor rows, from the first page with no filter.
+        """
+        self.scheme_editor = SchemeEditor(self.scheme)
+        window["-SCHEME_FILTER-"].update("")
+        self.show_scheme_page(window)
+
+    def record_scheme_edits(self, values: dict):
+        """
+        Copies the frequencies entered on the current page into the editor, before the page changes or is saved.
+        """
+        for slot, (index, show_path, frequency) in enumerate(self.scheme_editor.visible_rows()):
+            if f"-SCHEME_FREQ_{slot}-" in values:
+                self.scheme_editor.set_frequency(index, values[f"-SCHEME_FREQ_{slot}-"])
+
+    def show_scheme_page(self, window: sg.Window):
+        """
+        Fills the editor rows with the current page of the scheme, disabling any rows past the end of it.
+        """
+        rows: list = self.scheme_editor.visible_rows()
+
+        for slot in range(self.scheme_editor.page_size):
+            index, show_path, frequency = rows[slot] if slot < len(rows) else (None, "", "")
+            window[f"-SCHEME_FREQ_{slot}-"].update(value=frequency, disabled=index is None)
+            window[f"-SCHEME_SHOW_{slot}-"].update(show_path)
+
+        window["-SCHEME_PAGE-"].update(self.scheme_page_text())
+
+    def scheme_page_text(self) -> str:
+        editor: SchemeEditor = self.scheme_editor
+        return f"Page {editor.page + 1} of {editor.page_count} ({len(editor.matches)} shows)"
 
     # ---------------------------- Static Data Population Methods --------------------------
 
@@ -234,7 +414,7 @@ class Interface:
 
     @staticmethod
     def get_shows(path: Path = PathManager.TV_PATH) -> list:
-        return [PathManager.TV_PATH.stem] + [show.stem for show in path.iterdir() if show.is_dir() and show.stem != ".scheme"]
+        return [PathManager.TV_PATH.stem] + [show.stem for show in Library.get_library(path).shows()]
 
     @staticmethod
     def get_episodes(path: Path = PathManager.TV_PATH) -> list:
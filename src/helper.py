@@ -1,14 +1,32 @@
 from pathlib import Path
-import os
+import shutil
+import sys
 
 
 class PathManager:
     # --------------------- Class Variables -----------------------------
     PROG_PATH: Path = Path("C:/Program Files/")
     PROG_PATH_86: Path = Path("C:/Program Files (x86)/")
-    USER_PATH: Path = Path(os.environ['USERPROFILE'])
+    MAC_VLC_PATH: Path = Path("/Applications/VLC.app/Contents/MacOS/VLC")
+    # Home folder of the current user. This is USERPROFILE on Windows and HOME elsewhere
+    USER_PATH: Path = Path.home()
     TV_PATH: Path = None
+
+    # Playlist file that is written for VLC to open when a playlist is launched
+    PLAYLIST_PATH: Path = USER_PATH.joinpath(".vlc_rand_playlist.xspf")
     VLC_PATH: Path = None
+
+    # Also write episode markers to .eps files in each show folder, for older versions sharing the same TV_PATH
+    MIRROR_EPS_FILES: bool = False
+
+    # Keep the library index up to date in the background while the GUI is open, using inotify where available
+    WATCH_LIBRARY: bool = False
+
+    # Feed VLC a few episodes at a time over its RC interface, only marking episodes once they play
+    CONTROL_VLC: bool = False
+
+    # Budget playlists with durations estimated from file sizes, probing the videos in the background instead
+    ESTIMATE_DURATIONS: bool = False
     VIDEO_EXTENSIONS: list = [".264", ".3ga", ".3gp", ".aac", ".avi", ".cda", ".dash", ".dvr", ".flac", ".ifo", ".m2t",
                               ".m2ts", ".m3u8", ".m4v", ".mkv", ".mov", ".mp4", ".mpg", ".mts", ".ogg", ".ogv", ".opus",
                               ".pls", ".rec", ".rmvb", ".snd", ".sub", ".ts", ".vob", ".webm", ".wma", ".mmv", ".zab"]
@@ -20,7 +38,11 @@ class PathManager:
         :return: None
         """
         write_string = f"TV_PATH,{cls.TV_PATH}\n" \
-                       f"VLC_PATH,{cls.VLC_PATH}"
+                       f"VLC_PATH,{cls.VLC_PATH}\n" \
+                       f"MIRROR_EPS_FILES,{cls.MIRROR_EPS_FILES}\n" \
+                       f"WATCH_LIBRARY,{cls.WATCH_LIBRARY}\n" \
+                       f"CONTROL_VLC,{cls.CONTROL_VLC}\n" \
+                       f"ESTIMATE_DURATIONS,{cls.ESTIMATE_DURATIONS}"
 
         with open(cls.USER_PATH.joinpath(".vlc_rand"), "w") as file:
             file.write(write_string)
@@ -41,11 +63,23 @@ class PathManager:
                     if line_split == line:
                         return
 
+                    # Paths that were never set are saved as None
+                    if line_split[1].rstrip("\n") == "None":
+                        continue
+
                     # Handle \n and potential for quotes around file names before assigning
                     if line_split[0] == "TV_PATH":
                         cls.TV_PATH = Path(line_split[1].rstrip("\n").strip('\"'))
                     if line_split[0] == "VLC_PATH":
                         cls.VLC_PATH = Path(line_split[1].rstrip("\n").strip('\"'))
+                    if line_split[0] == "MIRROR_EPS_FILES":
+                        cls.MIRROR_EPS_FILES = line_split[1].rstrip("\n") == "True"
+                    if line_split[0] == "WATCH_LIBRARY":
+                        cls.WATCH_LIBRARY = line_split[1].rstrip("\n") == "True"
+                    if line_split[0] == "CONTROL_VLC":
+                        cls.CONTROL_VLC = line_split[1].rstrip("\n") == "True"
+                    if line_split[0] == "ESTIMATE_DURATIONS":
+                        cls.ESTIMATE_DURATIONS = line_split[1].rstrip("\n") == "True"
 
         except FileNotFoundError:
             return
@@ -61,10 +95,17 @@ class PathManager:
         if cls.VLC_PATH:
             return True
 
-        if cls.PROG_PATH.joinpath("VideoLAN").exists():
-            cls.VLC_PATH = Path("C:/Program Files/VideoLAN/VLC/vlc.exe")
-        elif cls.PROG_PATH_86.joinpath("VideoLAN").exists():
-            cls.VLC_PATH = Path("C:/Program Files (x86)/VideoLAN/VLC/vlc.exe")
+        if sys.platform == "win32":
+            if cls.PROG_PATH.joinpath("VideoLAN").exists():
+                cls.VLC_PATH = Path("C:/Program Files/VideoLAN/VLC/vlc.exe")
+            elif cls.PROG_PATH_86.joinpath("VideoLAN").exists():
+                cls.VLC_PATH = Path("C:/Program Files (x86)/VideoLAN/VLC/vlc.exe")
+
+        # Elsewhere, use VLC from the PATH, or the default install location on macOS
+        elif shutil.which("vlc"):
+            cls.VLC_PATH = Path(shutil.which("vlc"))
+        elif cls.MAC_VLC_PATH.exists():
+            cls.VLC_PATH = cls.MAC_VLC_PATH
 
         return True
 
@@ -0,0 +1,511 @@
+# Persistent index of the TV_PATH directory tree
+from src.helper import PathManager
+from src.listing import DirectoryCache, DirectoryEntry
+from src.natsort import NaturalSort
+from src.profiler import Profiler
+
+from bisect import bisect_left, bisect_right
+from pathlib import Path
+import os
+import sqlite3
+import threading
+
+
+class Library:
+    # --------------------- Class Variables -----------------------------
+    DB_NAME: str = ".library.db"
+    ROOT: str = "."
+
+    # Seconds that a directory listing is reused before the index is read again. Changes made through this library are
+    # seen straight away, while the TTL bounds how long changes from another process sharing the index go unseen
+    LISTING_TTL: float = DirectoryCache.DEFAULT_TTL
+
+    # Seconds to wait for another process to finish writing to the index, such as the workers of a PlaylistBatch
+    BUSY_TIMEOUT: float = 30
+
+    # Open libraries, keyed by TV_PATH, so that every Show and Playlist shares a single connection
+    _libraries: dict = {}
+    _libraries_lock = threading.Lock()
+
+    def __init__(self, tv_path: Path, read_only: bool = False):
+        """
+        :param tv_path: Root of the library
+        :param read_only: Open an existing index without writing to it. Its tables must already have been created
+        """
+        self.tv_path: Path = tv_path
+        self.read_only: bool = read_only
+
+        # The index lives alongside the schemes so that it travels with the library
+        db_folder: Path = tv_path.joinpath(".scheme")
+        self.db_path: Path = db_folder.joinpath(self.DB_NAME)
+        self.lock = threading.RLock()
+
+        if read_only:
+            self.connection = sqlite3.connect(f"{self.db_path.as_uri()}?mode=ro", uri=True,
+                                              timeout=self.BUSY_TIMEOUT, check_same_thread=False)
+        else:
+            db_folder.mkdir(exist_ok=True)
+            self.connection = sqlite3.connect(self.db_path.as_posix(), timeout=self.BUSY_TIMEOUT,
+                                              check_same_thread=False)
+            self.create_tables()
+
+        # Compiled EpisodeOrders, keyed by show key. Dropped whenever a folder in the show is relisted
+        self.episode_orders: dict = {}
+
+        # Listings of indexed directories, keyed by directory key, shared by every lookup
+        self.listings: DirectoryCache = DirectoryCache(self.load_listing, self.LISTING_TTL, self.lock)
+
+        # Optional LibraryWatcher keeping the index up to date in the background
+        self.watcher = None
+
+    @classmethod
+    def get_library(cls, tv_path: Path = None, rescan: bool = False):
+        """
+        Returns the shared library for a TV path, opening and scanning it the first time it is requested.
+        :param tv_path: Root of the library. Defaults to PathManager.TV_PATH
+        :param rescan: Rescan the library even if it has already been opened in this session
+        :return: Library
+        """
+        tv_path = tv_path or PathManager.TV_PATH
+
+        with cls._libraries_lock:
+            library = cls._libraries.get(tv_path)
+
+            if library is None:
+                library = Library(tv_path)
+                cls._libraries[tv_path] = library
+                rescan = True
+
+        # A running watcher has already applied changes as they happened, so only its pending changes are needed
+        if rescan and library.watcher is not None and library.watcher.running:
+            library.watcher.sync()
+        elif rescan:
+            library.rescan()
+
+        return library
+
+    @classmethod
+    def attach(cls, tv_path: Path = None, read_only: bool = False):
+        """
+        Returns the shared library for a TV path from its existing index, without scanning it. For processes that work
+        from an index kept up to date by another process, such as the workers of a PlaylistBatch.
+        :param tv_path: Root of the library. Defaults to PathManager.TV_PATH
+        :param read_only: Open the index read only, leaving every write to the process that owns it
+        :return: Library
+        """
+        tv_path = tv_path or PathManager.TV_PATH
+
+        with cls._libraries_lock:
+            library = cls._libraries.get(tv_path)
+
+            if library is None:
+                library = Library(tv_path, read_only)
+                cls._libraries[tv_path] = library
+
+        return library
+
+    def create_tables(self):
+        """
+        Creates the index tables if they do not already exist.
+        directories: Every indexed directory and the mtime it had when last listed
+        entries: Every video file and subdirectory, with its position in the human sorted listing of its parent
+        :return: None
+        """
+        with self.lock, self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS directories "
+                                    "(path TEXT PRIMARY KEY, mtime REAL)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS entries "
+                                    "(path TEXT PRIMARY KEY, parent TEXT, name TEXT, is_dir INTEGER, "
+                                    "size INTEGER, mtime REAL, position INTEGER)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS entries_parent ON entries (parent, position)")
+
+    @property
+    def indexed(self) -> bool:
+        """
+        Whether the library has been scanned into the index at least once.
+        """
+        with self.lock:
+            return self.connection.execute("SELECT 1 FROM directories LIMIT 1").fetchone() is not None
+
+    # --------------------- Path Conversion ----------------------------
+    def relative(self, path: Path) -> str:
+        """
+        Converts a path into the key used in the index.
+        :param path: Absolute path, or path relative to the TV path
+        :return: Posix path relative to the TV path. Raises ValueError if the path is outside the library
+        """
+        return Path(path).relative_to(self.tv_path).as_posix()
+
+    def absolute(self, key: str) -> Path:
+        """
+        Converts an index key back into a path beneath the TV path.
+        """
+        return self.tv_path if key == self.ROOT else self.tv_path.joinpath(key)
+
+    # --------------------- Scanning ----------------------------
+    def rescan(self, path: Path = None):
+        """
+        Brings the index up to date with the filesystem. Only directories whose mtime has changed since they were last
+        listed are listed again. Unchanged directories are only stat'ed to check for changes further down the tree.
+        :param path: Directory to rescan from. Defaults to the whole library
+        :return: None
+        """
+        key: str = self.ROOT if path is None else self.relative(path)
+
+        with self.lock:
+            known_mtimes: dict = dict(self.connection.execute("SELECT path, mtime FROM directories"))
+
+            with self.connection:
+                pending: list = [key]
+                while pending:
+                    key = pending.pop()
+                    pending += self.scan_directory(key, known_mtimes.get(key))
+
+    def refresh(self, keys: list, relist: bool = False) -> list:
+        """
+        Brings only the given directories up to date, along with any new directories beneath them, so that the cost
+        depends on what has changed rather than on the size of the library.
+        :param keys: Index keys of directories that may have changed
+        :param relist: List the directories even if their mtime is unchanged, such as when a video was rewritten
+        :return: Keys of the directories that were added to the index
+        """
+        added: list = []
+
+        with self.lock:
+            with self.connection:
+                pending: list = [(key, False) for key in keys]
+                while pending:
+                    key, new = pending.pop()
+                    known = self.connection.execute("SELECT mtime FROM directories WHERE path = ?", (key,)).fetchone()
+                    subdirectories: list = self.scan_directory(key, None if relist or known is None else known[0])
+
+                    if new:
+                        added.append(key)
+
+                    # Existing subdirectories report their own changes, so only continue into new ones
+                    for subdirectory in subdirectories:
+                        if not self.connection.execute("SELECT 1 FROM directories WHERE path = ?",
+                                                       (subdirectory,)).fetchone():
+                            pending.append((subdirectory, True))
+
+        return added
+
+    def scan_directory(self, key: str, known_mtime: float = None) -> list:
+        """
+        Relists a directory if it has changed since it was last indexed.
+        :param key: Index key of the directory
+        :param known_mtime: The mtime recorded when the directory was last listed
+        :return: Keys of the subdirectories to continue the scan in
+        """
+        try:
+            with Profiler.operation("stat"):
+                mtime: float = os.stat(self.absolute(key)).st_mtime
+        except OSError:
+            self.remove_directory(key)
+            return []
+
+        # Directory is unchanged, so the stored listing is still valid. Carry on down to catch changes in subfolders
+        if known_mtime == mtime:
+            return [row[0] for row in self.connection.execute("SELECT path FROM entries WHERE parent = ? AND is_dir",
+                                                              (key,))]
+
+        self.invalidate_show(key)
+
+        rows: list = []
+        try:
+            with Profiler.operation("scandir"), os.scandir(self.absolute(key)) as directory:
+                for entry in directory:
+                    if entry.name == ".scheme":
+                        continue
+
+                    if entry.is_dir():
+                        rows.append([self.join(key, entry.name), key, entry.name, 1, 0, 0])
+                    elif Path(entry.name).suffix in PathManager.VIDEO_EXTENSIONS:
+                        with Profiler.operation("stat"):
+                            stat = entry.stat()
+                        rows.append([self.join(key, entry.name), key, entry.name, 0, stat.st_size, stat.st_mtime])
+        except OSError:
+            self.remove_directory(key)
+            return []
+
+        # Store the position in the human sorted listing so that reads do not need to sort
+        rows.sort(key=lambda row: NaturalSort.key(row[2]))
+        rows = [row + [position] for position, row in enumerate(rows)]
+
+        # Remove anything that has disappeared since the last listing, including the contents of removed folders
+        current: set = {row[0] for row in rows}
+        for old_key, is_dir in self.connection.execute("SELECT path, is_dir FROM entries WHERE parent = ?",
+                                                       (key,)).fetchall():
+            if old_key in current:
+                continue
+
+            if is_dir:
+                self.remove_directory(old_key)
+            else:
+                self.connection.execute("DELETE FROM entries WHERE path = ?", (old_key,))
+
+        self.connection.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        self.connection.execute("INSERT OR REPLACE INTO directories VALUES (?, ?)", (key, mtime))
+        self.listings.invalidate(key)
+
+        return [row[0] for row in rows if row[3]]
+
+    def remove_directory(self, key: str):
+        """
+        Removes a directory and everything beneath it from the index.
+        :param key: Index key of the directory
+        :return: None
+        """
+        self.invalidate_listings(key)
+
+        if key == self.ROOT:
+            self.connection.execute("DELETE FROM entries")
+            self.connection.execute("DELETE FROM directories")
+            return
+
+        # Compare prefixes with substr rather than LIKE, which ignores case and treats _ as a wildcard
+        prefix: str = key + "/"
+        for table in ["entries", "directories"]:
+            self.connection.execute(f"DELETE FROM {table} WHERE path = ? OR substr(path, 1, ?) = ?",
+                                    (key, len(prefix), prefix))
+
+    def invalidate_show(self, key: str):
+        """
+        Drops the compiled episode order of the show containing a directory. Changes to the root clear every show.
+        :param key: Index key of the changed directory
+        :return: None
+        """
+        with self.lock:
+            if key == self.ROOT:
+                self.episode_orders.clear()
+            else:
+                self.episode_orders.pop(key.split("/")[0], None)
+
+    def invalidate_listings(self, key: str = None):
+        """
+        Drops the cached listings of a directory and everything beneath it, so they are read from the index again.
+        :param key: Index key of the directory. Defaults to the whole library
+        :return: None
+        """
+        if key is None or key == self.ROOT:
+            self.listings.invalidate()
+        else:
+            self.listings.invalidate(key, recursive=True)
+
+    @staticmethod
+    def join(parent: str, name: str) -> str:
+        return name if parent == Library.ROOT else parent + "/" + name
+
+    # --------------------- Queries ----------------------------
+    def list_directory(self, path: Path, include_dirs: bool = True) -> list:
+        """
+        Returns the human sorted video files and subdirectories of an indexed directory.
+        :param path: Directory to list
+        :param include_dirs: Whether subdirectories should be included
+        :return: List of paths. Empty if the directory is not in the library
+        """
+        try:
+            key: str = self.relative(path)
+        except ValueError:
+            return []
+
+        return [entry.path for entry in self.listings.get(key).entries if include_dirs or entry.is_file()]
+
+    def load_listing(self, key: str) -> list:
+        """
+        Reads the human sorted entries of a directory from the index, for the listing cache.
+        :param key: Index key of the directory
+        :return: List of DirectoryEntries
+        """
+        with self.lock, Profiler.operation("index_query"):
+            rows: list = self.connection.execute("SELECT path, name, is_dir, size, mtime FROM entries "
+                                                 "WHERE parent = ? ORDER BY position", (key,)).fetchall()
+
+        return [DirectoryEntry(path, name, self.absolute(path), bool(is_dir), size, mtime)
+                for path, name, is_dir, size, mtime in rows]
+
+    def shows(self) -> list:
+        """
+        Returns the human sorted show folders in the root of the library.
+        """
+        return [entry.path for entry in self.listings.get(self.ROOT).entries if entry.is_dir()]
+
+    def show_path(self, path: Path) -> Path:
+        """
+        Returns the show that a path belongs to. Videos in the root of the library belong to the TV path itself.
+        """
+        key: str = self.relative(path)
+
+        if "/" not in key and not self.is_directory(path):
+            return self.tv_path
+
+        return self.absolute(key.split("/")[0])
+
+    def lookup(self, path: Path):
+        """
+        Returns the index row (is_dir, size, mtime) for a path, or None if it is not in the library.
+        """
+        try:
+            key: str = self.relative(path)
+        except ValueError:
+            return None
+
+        if key == self.ROOT:
+            return 1, 0, 0
+
+        # Entries are looked up in their parent's listing, so walking a folder only reads the index once
+        parent: str = key.rpartition("/")[0] or self.ROOT
+        entry: DirectoryEntry = self.listings.get(parent).find(key)
+
+        return (int(entry.is_dir()), entry.size, entry.mtime) if entry else None
+
+    def is_directory(self, path: Path) -> bool:
+        row = self.lookup(path)
+        return bool(row and row[0])
+
+    def is_episode(self, path: Path) -> bool:
+        row = self.lookup(path)
+        return bool(row and not row[0])
+
+    def exists(self, path: Path) -> bool:
+        return self.lookup(path) is not None
+
+    def file_info(self, path: Path):
+        """
+        Returns the size and mtime recorded for a video file, or None if it is not in the library.
+        """
+        row = self.lookup(path)
+        return (row[1], row[2]) if row and not row[0] else None
+
+    def episode_order(self, show_path: Path):
+        """
+        Returns the flattened episode order of a show, compiling it from the index the first time it is requested.
+        :param show_path: Show folder, or TV_PATH for videos in the root of the library
+        :return: EpisodeOrder
+        """
+        key: str = self.relative(show_path)
+
+        with self.lock:
+            order = self.episode_orders.get(key)
+
+            if order is None:
+                order = self.compile_show(key)
+                self.episode_orders[key] = order
+
+        return order
+
+    def compile_show(self, key: str):
+        """
+        Walks the indexed folders of a show depth first, in the same human sorted order that the show would be watched.
+        :param key: Index key of the show
+        :return: EpisodeOrder
+        """
+        # Videos in the root of the library are treated as one show, ignoring the show folders beside them
+        if key == self.ROOT:
+            rows: list = self.connection.execute("SELECT path, parent, is_dir FROM entries "
+                                                 "WHERE parent = ? AND NOT is_dir ORDER BY position",
+                                                 (key,)).fetchall()
+        else:
+            prefix: str = key + "/"
+            rows: list = self.connection.execute("SELECT path, parent, is_dir FROM entries "
+                                                 "WHERE substr(path, 1, ?) = ? ORDER BY parent, position",
+                                                 (len(prefix), prefix)).fetchall()
+
+        children: dict = {}
+        for path, parent, is_dir in rows:
+            children.setdefault(parent, []).append((path, is_dir))
+
+        order = EpisodeOrder()
+
+        # Each entry's sort key is the tuple of positions leading to it, so the order sorts by key
+        pending: list = [(key, ())]
+        while pending:
+            parent, parent_key = pending.pop()
+            entries: list = children.get(parent, [])
+
+            # Push in reverse so that the first entry is walked first
+            for position in reversed(range(len(entries))):
+                path, is_dir = entries[position]
+                entry_key: tuple = parent_key + (position,)
+                order.positions[path] = entry_key
+
+                if is_dir:
+                    pending.append((path, entry_key))
+                else:
+                    order.index[path] = None
+
+        # Pending is a stack, so episodes were found in order within each folder but not across folders
+        episodes: list = sorted(order.index, key=order.positions.get)
+        for index, path in enumerate(episodes):
+            order.index[path] = index
+
+        order.episodes = [self.absolute(path) for path in episodes]
+        order.keys = [order.positions[path] for path in episodes]
+        return order
+
+    def close(self):
+        if self.watcher is not None:
+            self.watcher.stop()
+
+        with self.lock:
+            self.connection.close()
+
+        with self._libraries_lock:
+            if self._libraries.get(self.tv_path) is self:
+                del self._libraries[self.tv_path]
+
+
+class EpisodeOrder:
+    """
+    The flattened, human sorted list of episodes in a show. Positions into this list are used as episode markers.
+    """
+    def __init__(self):
+        self.episodes: list = []
+        self.keys: list = []
+
+        # Index keys of every entry in the show mapped to their sort key, and of every episode to its position
+        self.positions: dict = {}
+        self.index: dict = {}
+
+    def __len__(self):
+        return len(self.episodes)
+
+    def find(self, key: str):
+        """
+        Returns the position of the episode, or of the first episode at or after the folder, for an index key.
+        Empty folders resolve to the episode that follows them, wrapping to the first episode at the end of the show.
+        :param key: Index key of an episode or folder in the show
+        :return: Position in the list of episodes, or None if the key is not in the show or the show has no episodes
+        """
+        if not self.episodes or key not in self.positions:
+            return None
+
+        if key in self.index:
+            return self.index[key]
+
+        return bisect_left(self.keys, self.positions[key]) % len(self.episodes)
+
+    def find_following(self, key: str):
+        """
+        Returns the position of an episode, or for an episode that is no longer in the show, such as one that was
+        renamed or deleted, the position of the first episode that would have followed it. Wraps to the first episode.
+        :param key: Index key of an episode in the show, or of one that used to be
+        :return: Position in the list of episodes, or None if the show has no episodes
+        """
+        if not self.episodes:
+            return None
+
+        if key in self.positions:
+            return self.find(key)
+
+        # Folders are listed in natural order, so episodes sort by the natural keys of each part of their path
+        episode_keys: list = [self.natural_key(path) for path in sorted(self.index, key=self.index.get)]
+        return bisect_right(episode_keys, self.natural_key(key)) % len(self.episodes)
+
+    @staticmethod
+    def natural_key(key: str) -> tuple:
+        return tuple(NaturalSort.key(name) for name in key.split("/"))
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,114 @@
+# In-memory cache of directory listings from the library index, shared by every Show traversal
+import threading
+import time
+
+
+class DirectoryEntry:
+    """
+    A video or subdirectory in a listing. Mirrors the parts of os.DirEntry that traversal needs, so that the type
+    recorded when the directory was scanned can be checked without touching the disk or the index again.
+    """
+    __slots__ = ["key", "name", "path", "directory", "size", "mtime"]
+
+    def __init__(self, key: str, name: str, path, directory: bool, size: int = 0, mtime: float = 0):
+        self.key: str = key
+        self.name: str = name
+        self.path = path
+        self.directory: bool = directory
+        self.size: int = size
+        self.mtime: float = mtime
+
+    def is_dir(self) -> bool:
+        return self.directory
+
+    def is_file(self) -> bool:
+        return not self.directory
+
+
+class DirectoryListing:
+    """
+    The human sorted entries of one directory, with a lookup by index key.
+    """
+    def __init__(self, entries: list, loaded_at: float):
+        self.entries: list = entries
+        self.by_key: dict = {entry.key: entry for entry in entries}
+        self.loaded_at: float = loaded_at
+
+    def find(self, key: str):
+        return self.by_key.get(key)
+
+
+class DirectoryCache:
+    # --------------------- Class Variables -----------------------------
+    DEFAULT_TTL: float = 30
+
+    def __init__(self, loader, ttl: float = DEFAULT_TTL, lock=None):
+        """
+        :param loader: Function returning the list of DirectoryEntries for a directory key
+        :param ttl: Seconds a listing is reused before it is loaded again. 0 disables the cache
+        :param lock: Lock to hold while loading. Pass the loader's own lock so the two cannot be taken in either order
+        """
+        self.loader = loader
+        self.ttl: float = ttl
+        self.lock = lock or threading.RLock()
+
+        self.listings: dict = {}
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def get(self, key: str) -> DirectoryListing:
+        """
+        Returns the listing of a directory, loading it if it is not cached or has expired.
+        :param key: Index key of the directory
+        :return: DirectoryListing. Empty if the directory has no entries
+        """
+        with self.lock:
+            now: float = time.monotonic()
+            listing: DirectoryListing = self.listings.get(key)
+
+            if listing is not None and now - listing.loaded_at < self.ttl:
+                self.hits += 1
+                return listing
+
+            self.misses += 1
+            listing = DirectoryListing(self.loader(key), now)
+            self.listings[key] = listing
+
+            return listing
+
+    def invalidate(self, key: str = None, recursive: bool = False):
+        """
+        Drops cached listings so that they are loaded again on next use.
+        :param key: Index key of the directory. Defaults to every directory
+        :param recursive: Drop the listings of every directory beneath it as well
+        :return: None
+        """
+        with self.lock:
+            if key is None:
+                self.listings.clear()
+                return
+
+            self.listings.pop(key, None)
+
+            if recursive:
+                prefix: str = key + "/"
+                for cached in [cached for cached in self.listings if cached.startswith(prefix)]:
+                    del self.listings[cached]
+
+    def stats(self) -> dict:
+        """
+        Returns the hit and miss counts, for tuning the TTL.
+        """
+        with self.lock:
+            lookups: int = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0,
+                    "listings": len(self.listings), "ttl": self.ttl}
+
+    def reset_stats(self):
+        with self.lock:
+            self.hits = 0
+            self.misses = 0
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,359 @@
+# Episode markers for every show, stored in a single table of the library index
+from src.helper import PathManager
+from src.library import Library
+from src.profiler import Profiler
+
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+import os
+import sqlite3
+
+
+class MarkerStore:
+    # --------------------- Class Variables -----------------------------
+    EPS_FILE: str = ".eps.txt"
+
+    # Folders listed at once when deleting .eps files. Listings are mostly waiting on the disk or network
+    RESET_WORKERS: int = 8
+
+    # Open stores, keyed by TV_PATH, sharing the connection of their library
+    _stores: dict = {}
+
+    def __init__(self, library: Library):
+        self.library: Library = library
+
+        # Markers waiting to be committed, keyed by show key. Later markers for a show replace earlier ones
+        self.pending: dict = {}
+
+        # Single background thread for commit_async, and the errors from commits that failed on it
+        self.executor: ThreadPoolExecutor = None
+        self.errors: list = []
+
+        self.create_tables()
+        self.migrate_eps_files()
+
+    @classmethod
+    def get_store(cls, library: Library = None):
+        """
+        Returns the shared marker store for a library, importing any .eps files the first time it is opened.
+        :param library: Defaults to the library for PathManager.TV_PATH
+        :return: MarkerStore
+        """
+        library = library or Library.get_library()
+
+        with library.lock:
+            store = cls._stores.get(library.tv_path)
+
+            if store is None or store.library is not library:
+                store = MarkerStore(library)
+                cls._stores[library.tv_path] = store
+
+        return store
+
+    def create_tables(self):
+        """
+        markers: The current episode of each show, keyed by show. Videos in the root of TV_PATH share the root key
+        settings: Flags for one-time tasks, such as importing .eps files
+        :return: None
+        """
+        with self.library.lock, self.library.connection:
+            self.library.connection.execute("CREATE TABLE IF NOT EXISTS markers (show TEXT PRIMARY KEY, episode TEXT)")
+            self.library.connection.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)")
+
+    # --------------------- Marker Functions ----------------------------
+    def get(self, show_path: Path):
+        """
+        Returns the committed marker for a show. This is usually an episode, but markers imported from .eps files
+        may point to a folder, in which case the first episode at or after that folder is current.
+        :param show_path: Show folder, or TV_PATH for videos in the root of the library
+        :return: Path of the marker, or None if the show has no marker
+        """
+        with self.library.lock, Profiler.operation("marker_read"):
+            row = self.library.connection.execute("SELECT episode FROM markers WHERE show = ?",
+                                                  (self.library.relative(show_path),)).fetchone()
+
+        return self.library.absolute(row[0]) if row else None
+
+    def stage(self, show_path: Path, episode: Path):
+        """
+        Queues a marker to be written on the next commit.
+        :param show_path: Show folder, or TV_PATH for videos in the root of the library
+        :param episode: The show's current episode
+        :return: None
+        """
+        with self.library.lock:
+            self.pending[self.library.relative(show_path)] = self.library.relative(episode)
+
+    def set(self, show_path: Path, episode: Path):
+        """
+        Writes a single marker immediately, along with any other staged markers.
+        """
+        self.stage(show_path, episode)
+        self.commit()
+
+    def repair(self, show_path: Path, episode: Path) -> bool:
+        """
+        Replaces a marker that no longer points to an episode, such as one that was renamed or deleted, without writing
+        the markers staged for a playlist. Libraries opened read only, as in the workers of a PlaylistBatch, are left
+        as they are, and the marker is repaired again next time.
+        :return: True if the marker was written
+        """
+        if self.library.read_only:
+            return False
+
+        try:
+            with self.library.lock, self.library.connection, Profiler.operation("marker_write"):
+                self.library.connection.execute("INSERT OR REPLACE INTO markers VALUES (?, ?)",
+                                                (self.library.relative(show_path), self.library.relative(episode)))
+
+            if PathManager.MIRROR_EPS_FILES:
+                self.write_eps_files(show_path, episode)
+
+        # The repaired episode is still used, so a failed write only means repairing the marker again next time
+        except (OSError, sqlite3.Error):
+            return False
+
+        return True
+
+    def commit(self) -> int:
+        """
+        Writes all staged markers in a single transaction, then mirrors them to .eps files if that is enabled.
+        :return: Number of shows whose markers were written
+        """
+        with self.library.lock:
+            pending: dict = self.pending
+            self.pending = {}
+
+            if not pending:
+                return 0
+
+            try:
+                with self.library.connection, Profiler.operation("marker_write"):
+                    self.library.connection.executemany("INSERT OR REPLACE INTO markers VALUES (?, ?)",
+                                                        pending.items())
+
+            # Stage the markers again so that they are not lost, without replacing any staged since
+            except sqlite3.Error:
+                self.pending = {**pending, **self.pending}
+                raise
+
+        if PathManager.MIRROR_EPS_FILES:
+            for show, episode in pending.items():
+                self.write_eps_files(self.library.absolute(show), self.library.absolute(episode))
+
+        return len(pending)
+
+    def commit_async(self) -> Future:
+        """
+        Commits staged markers on a background thread, so that VLC can start without waiting for the disk.
+        Commits requested while another is running are written together by the next one. Errors are kept in
+        self.errors rather than raised, and can be collected with wait_for_commits.
+        :return: Future of the number of shows whose markers were written
+        """
+        with self.library.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="marker_commit")
+
+            return self.executor.submit(self.commit_or_record)
+
+    def commit_or_record(self) -> int:
+        try:
+            return self.commit()
+        except (OSError, sqlite3.Error) as err:
+            self.errors.append(err)
+            return 0
+
+    def wait_for_commits(self, timeout: float = None) -> list:
+        """
+        Waits for background commits to finish.
+        :param timeout: Seconds to wait. Defaults to waiting until they are done
+        :return: Errors from failed commits since the last wait
+        """
+        with self.library.lock:
+            executor: ThreadPoolExecutor = self.executor
+
+        # The thread commits in order, so once this has run every earlier commit has finished
+        if executor is not None:
+            executor.submit(lambda: None).result(timeout)
+
+        with self.library.lock:
+            errors: list = self.errors
+            self.errors = []
+
+        return errors
+
+    def discard(self):
+        """
+        Drops any staged markers without writing them.
+        """
+        with self.library.lock:
+            self.pending = {}
+
+    def remove(self, show_path: Path):
+        """
+        Removes the marker for a single show, so that it starts again from its first episode.
+        :param show_path: Show folder, or TV_PATH for videos in the root of the library
+        :return: None
+        """
+        key: str = self.library.relative(show_path)
+
+        with self.library.lock, self.library.connection:
+            self.pending.pop(key, None)
+            self.library.connection.execute("DELETE FROM markers WHERE show = ?", (key,))
+
+    def clear(self):
+        """
+        Removes every marker, so that all shows start again from their first episode.
+        :return: None
+        """
+        with self.library.lock, self.library.connection:
+            self.pending = {}
+            self.library.connection.execute("DELETE FROM markers")
+
+    def reset(self, show_paths: list = None) -> dict:
+        """
+        Resets markers so that shows start again from their first episode, and deletes any .eps files in their folders.
+        :param show_paths: Show folders to reset, or TV_PATH for the videos in the root of the library.
+                           Defaults to every show
+        :return: Number of markers and .eps files removed
+        """
+        with self.library.lock, self.library.connection:
+            if show_paths is None:
+                self.pending = {}
+                markers: int = self.library.connection.execute("DELETE FROM markers").rowcount
+            else:
+                keys: list = list(dict.fromkeys(self.library.relative(show_path) for show_path in show_paths))
+                for key in keys:
+                    self.pending.pop(key, None)
+                markers: int = self.library.connection.executemany("DELETE FROM markers WHERE show = ?",
+                                                                   [(key,) for key in keys]).rowcount
+
+        # Resetting every show clears the whole library. The root of the library only holds the marker for its videos,
+        # so its folders are left alone unless they are shows being reset
+        if show_paths is None:
+            folders: list = [(self.library.tv_path, True)]
+        else:
+            folders: list = [(self.library.absolute(key), key != self.library.ROOT) for key in keys]
+
+        return {"markers": markers, "eps_files": self.delete_eps_files(folders)}
+
+    # --------------------- .eps File Functions ----------------------------
+    def delete_eps_files(self, folders: list) -> int:
+        """
+        Deletes .eps files from folders in parallel. Each listed folder queues its subfolders, so one large show does
+        not hold up the rest.
+        :param folders: List of (folder, recursive) pairs
+        :return: Number of .eps files deleted
+        """
+        deleted: int = 0
+
+        with ThreadPoolExecutor(max_workers=self.RESET_WORKERS) as executor:
+            running: set = {executor.submit(self.delete_eps_file, folder, recursive) for folder, recursive in folders}
+
+            while running:
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    count, subfolders = future.result()
+                    deleted += count
+                    running |= {executor.submit(self.delete_eps_file, folder, True) for folder in subfolders}
+
+        return deleted
+
+    @classmethod
+    def delete_eps_file(cls, folder, recursive: bool = True) -> tuple:
+        """
+        Lists a folder once, deleting its .eps file. File types come from the listing, so entries are not stat'd again.
+        :param folder: Folder to clear
+        :param recursive: Return the subfolders to clear as well
+        :return: Number of files deleted, and a list of subfolders
+        """
+        deleted: int = 0
+        subfolders: list = []
+
+        try:
+            with Profiler.operation("scandir"), os.scandir(folder) as directory:
+                entries: list = list(directory)
+        except OSError:
+            return deleted, subfolders
+
+        for entry in entries:
+            if entry.name == cls.EPS_FILE and entry.is_file():
+                try:
+                    os.unlink(entry.path)
+                    deleted += 1
+                except FileNotFoundError:
+                    pass
+
+            elif recursive and entry.name != ".scheme" and entry.is_dir():
+                subfolders.append(entry.path)
+
+        return deleted, subfolders
+
+    def migrate_eps_files(self):
+        """
+        One-time import of the .eps files written by older versions. Each show's .eps file is followed down through
+        the folders' .eps files to the episode it points to.
+        :return: None
+        """
+        with self.library.lock:
+            if self.library.connection.execute("SELECT value FROM settings WHERE key = 'eps_files_migrated'"
+                                               ).fetchone():
+                return
+
+            markers: dict = {}
+            for show_path in [self.library.tv_path] + self.library.shows():
+                marker = self.read_eps_files(show_path)
+
+                if marker is not None:
+                    markers[self.library.relative(show_path)] = self.library.relative(marker)
+
+            with self.library.connection:
+                self.library.connection.executemany("INSERT OR REPLACE INTO markers VALUES (?, ?)", markers.items())
+                self.library.connection.execute("INSERT OR REPLACE INTO settings VALUES ('eps_files_migrated', '1')")
+
+    def read_eps_files(self, show_path: Path):
+        """
+        Follows the .eps files of a show down to the marked episode, or the deepest marked folder.
+        :param show_path: Show folder, or TV_PATH for videos in the root of the library
+        :return: Marked path within the show, or None if it has no valid .eps file
+        """
+        marker = None
+        search_path: Path = show_path
+
+        while True:
+            try:
+                with Profiler.operation("eps_read"):
+                    text: str = search_path.joinpath(self.EPS_FILE).read_text().strip()
+            except OSError:
+                return marker
+
+            # Ignore blank markers and markers left behind from a different TV_PATH
+            if not text or not self.library.exists(Path(text)) or Path(text).parent != search_path:
+                return marker
+
+            marker = Path(text)
+
+            if not self.library.is_directory(marker):
+                return marker
+
+            search_path = marker
+
+    def write_eps_files(self, show_path: Path, episode: Path):
+        """
+        Writes the .eps file in each folder between the episode and the show folder, so that older versions can still
+        find the current episode.
+        :param show_path: Show folder, or TV_PATH for videos in the root of the library
+        :param episode: The show's current episode
+        :return: None
+        """
+        path: Path = episode
+        while path != show_path and path != path.parent:
+            with Profiler.operation("eps_write"), open(path.parent.joinpath(self.EPS_FILE), "w") as file:
+                file.write(path.as_posix())
+
+            path = path.parent
+
+
+if __name__ == "__main__":
+    pass
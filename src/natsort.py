@@ -0,0 +1,108 @@
+# Natural sorting of file names, so that "Episode 2" comes before "Episode 10"
+from functools import lru_cache
+import re
+
+
+class NaturalSort:
+    """
+    Sort keys for file names, splitting each name into text and numbers once and memoizing the result, since the same
+    names are sorted again every time a folder is listed.
+    By default the order is the same as Show.human_sort for names in the same folder. Season and episode numbers in
+    forms such as S02E10 or 2x10 can be parsed as well, so that episodes sort by number even when the rest of their
+    names differ.
+    """
+    # --------------------- Class Variables -----------------------------
+    CACHE_SIZE: int = 65536
+
+    TOKENIZER = re.compile(r"([0-9]+)")
+
+    # S02E10, s2.e10 or S02 E10, and 2x10, but not resolutions such as 1920x1080
+    EPISODE_PATTERNS: list = [re.compile(r"(?<![a-z])s(\d{1,3})[ ._-]?e(\d{1,4})(?!\d)", re.IGNORECASE),
+                              re.compile(r"(?<![0-9a-z])(\d{1,2})x(\d{2,3})(?!\d)", re.IGNORECASE)]
+
+    @staticmethod
+    @lru_cache(maxsize=CACHE_SIZE)
+    def key(name: str) -> tuple:
+        """
+        Splits a name into lower case text and numbers.
+
+        key("Z23a")
+        ("z", 23, "a")
+
+        :param name: File or folder name
+        :return: Tuple of alternating text and numbers, always starting and ending with text
+        """
+        tokens: list = NaturalSort.TOKENIZER.split(name)
+
+        # human_sort keys the whole path, so the first token always has the folder in front of it and stays text
+        return (tokens[0].lower(),) + tuple(int(token) if index % 2 else NaturalSort.text(token)
+                                            for index, token in enumerate(tokens) if index)
+
+    @staticmethod
+    def text(token: str):
+        # Later text can still be a number in other scripts, such as Arabic-Indic digits, which human_sort treats as
+        # numbers
+        token = token.lower()
+        if token.isascii():
+            return token
+
+        try:
+            return int(token)
+        except ValueError:
+            return token
+
+    @staticmethod
+    @lru_cache(maxsize=CACHE_SIZE)
+    def episode_key(name: str) -> tuple:
+        """
+        Sorts names with a season and episode number by those numbers, ahead of names without them, which keep their
+        natural order.
+        :param name: File or folder name
+        :return: Tuple of whether a number was found, the season and episode numbers, and the natural key
+        """
+        for pattern in NaturalSort.EPISODE_PATTERNS:
+            match = pattern.search(name)
+
+            if match:
+                return 0, int(match.group(1)), int(match.group(2)), NaturalSort.key(name)
+
+        return 1, 0, 0, NaturalSort.key(name)
+
+    @classmethod
+    def parse_episode(cls, name: str):
+        """
+        :return: Season and episode numbers, or None if the name does not have them
+        """
+        key: tuple = cls.episode_key(name)
+        return None if key[0] else key[1:3]
+
+    @classmethod
+    def sort(cls, names: list, episodes: bool = False) -> list:
+        """
+        Sorts names naturally, returning a new list.
+        :param names: File or folder names
+        :param episodes: Sort by season and episode numbers where names have them
+        """
+        return sorted(names, key=cls.episode_key if episodes else cls.key)
+
+    @classmethod
+    def sort_paths(cls, paths: list, episodes: bool = False) -> list:
+        """
+        Sorts paths by their names only, for paths in the same folder.
+        """
+        key = cls.episode_key if episodes else cls.key
+        return sorted(paths, key=lambda path: key(path.name))
+
+    @classmethod
+    def cache_info(cls) -> dict:
+        info = cls.key.cache_info()
+        return {"hits": info.hits, "misses": info.misses, "size": info.currsize, "max_size": info.maxsize}
+
+    @classmethod
+    def clear_cache(cls):
+        cls.key.cache_clear()
+        cls.episode_key.cache_clear()
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,261 @@
+# Drives VLC over its remote control (RC) interface, feeding it a few episodes at a time and marking them as they play
+from src.helper import PathManager
+from src.playlist import Playlist
+
+from collections import deque
+from pathlib import Path
+from urllib.parse import unquote
+import socket
+import subprocess
+import time
+
+
+class RCConnection:
+    """
+    Line based connection to VLC's RC interface. Responses are read up to the next "> " prompt, or until no more
+    arrives for READ_TIMEOUT seconds where VLC does not send one.
+    """
+    READ_TIMEOUT: float = 0.2
+
+    def __init__(self, host: str, port: int, timeout: float = 5):
+        self.socket = socket.create_connection((host, port), timeout)
+
+        # Discard the greeting
+        self.read_lines()
+
+    def command(self, text: str) -> list:
+        """
+        Sends a command and returns the lines of the response, without prompts.
+        :raises ConnectionError: If VLC has closed the connection
+        """
+        self.socket.sendall(text.encode("utf-8") + b"\n")
+        return self.read_lines()
+
+    def read_lines(self) -> list:
+        data: bytes = b""
+        self.socket.settimeout(self.READ_TIMEOUT)
+
+        while True:
+            try:
+                chunk: bytes = self.socket.recv(4096)
+            except socket.timeout:
+                break
+
+            if not chunk:
+                raise ConnectionError("VLC closed the connection")
+            data += chunk
+
+            if data.endswith(b"> "):
+                break
+
+        lines: list = []
+        for line in data.decode("utf-8", errors="replace").splitlines():
+            line = line.lstrip("> ").strip()
+            if line:
+                lines.append(line)
+
+        return lines
+
+    def close(self):
+        self.socket.close()
+
+
+class PlayerController:
+    """
+    Starts VLC with its RC interface and keeps a small window of episodes enqueued ahead of playback, rather than
+    handing VLC the whole playlist at launch. Markers are only recorded for episodes that VLC actually plays.
+    """
+    # --------------------- Class Variables -----------------------------
+    RC_HOST: str = "127.0.0.1"
+    RC_PORT: int = 4221
+
+    # Episodes enqueued in VLC beyond the one playing
+    LOOKAHEAD: int = 3
+    POLL_INTERVAL: float = 1
+    CONNECT_TIMEOUT: float = 15
+
+    # When a show's marker moves on to an episode: once it starts playing, or once VLC moves past it
+    START: str = "start"
+    FINISH: str = "finish"
+
+    def __init__(self, episodes, lookahead: int = LOOKAHEAD, advance_on: str = START, host: str = RC_HOST,
+                 port: int = RC_PORT):
+        """
+        :param episodes: Iterable of episodes to play, such as from Playlist.stream_playlist or from_playlist
+        :param lookahead: Number of episodes to keep enqueued beyond the one playing
+        :param advance_on: START or FINISH
+        """
+        if advance_on not in [self.START, self.FINISH]:
+            raise ValueError(f"Invalid advance_on: {advance_on}")
+
+        self.episodes = iter(episodes)
+        self.lookahead: int = lookahead
+        self.advance_on: str = advance_on
+        self.host: str = host
+        self.port: int = port
+
+        self.process: subprocess.Popen = None
+        self.connection: RCConnection = None
+
+        # Episodes enqueued in VLC that have not started yet, and the one playing
+        self.window: deque = deque()
+        self.current: Path = None
+
+        # Episodes whose markers have been recorded, in the order they were played, and any errors saving them
+        self.played: list = []
+        self.errors: list = []
+
+    @classmethod
+    def from_playlist(cls, playlist: Playlist, **kwargs):
+        """
+        Creates a controller that plays a generated playlist, taking episodes from its queue as they are needed.
+        """
+        def take_episodes():
+            while playlist.video_queue:
+                yield playlist.video_queue.popleft()
+
+        return cls(take_episodes(), **kwargs)
+
+    # --------------------- Connection ----------------------------
+    def launch(self):
+        """
+        Starts VLC with the RC interface enabled, then connects to it.
+        :return: None
+        """
+        self.process = subprocess.Popen([PathManager.VLC_PATH.as_posix(), "--extraintf", "rc",
+                                         "--rc-host", f"{self.host}:{self.port}"])
+        self.connect()
+
+    def connect(self, timeout: float = CONNECT_TIMEOUT):
+        """
+        Connects to a running RC interface, waiting for it to start listening.
+        :raises ConnectionError: If it is not listening within the timeout
+        """
+        deadline: float = time.monotonic() + timeout
+
+        while True:
+            try:
+                self.connection = RCConnection(self.host, self.port)
+                return
+            except OSError as err:
+                if time.monotonic() > deadline or (self.process is not None and self.process.poll() is not None):
+                    raise ConnectionError(f"Unable to connect to VLC on {self.host}:{self.port}: {err}")
+
+            time.sleep(0.2)
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    # --------------------- Playback ----------------------------
+    def run(self) -> list:
+        """
+        Feeds VLC until the episodes run out and playback stops, or VLC is closed.
+        :return: Episodes whose markers were recorded
+        """
+        try:
+            self.fill_window()
+
+            while self.step():
+                time.sleep(self.POLL_INTERVAL)
+
+        except ConnectionError:
+            pass
+
+        finally:
+            self.close()
+            self.errors += Playlist.wait_for_markers()
+
+        return self.played
+
+    def step(self) -> bool:
+        """
+        Polls VLC once, recording markers for any episode that has started or finished, and tops up the window.
+        :return: False once playback has finished
+        """
+        status: dict = self.status()
+        playing: Path = self.find_episode(status.get("input"))
+
+        if playing is not None and playing != self.current:
+            if self.current is not None and self.advance_on == self.FINISH:
+                self.record(self.current)
+
+            # Anything enqueued before the new episode was skipped in VLC, so its marker is left alone
+            while self.window and self.window[0] != playing:
+                self.window.popleft()
+            if self.window:
+                self.window.popleft()
+
+            self.current = playing
+            if self.advance_on == self.START:
+                self.record(playing)
+
+            self.fill_window()
+
+        # Playback has reached the end of everything that was enqueued
+        if status.get("state") == "stopped" and not self.window:
+            if self.current is not None and self.advance_on == self.FINISH:
+                self.record(self.current)
+                self.current = None
+            return False
+
+        return True
+
+    def fill_window(self):
+        """
+        Enqueues episodes until the window is full. The first episode is started rather than enqueued.
+        """
+        while len(self.window) < self.lookahead + (self.current is None):
+            try:
+                episode: Path = next(self.episodes)
+            except StopIteration:
+                return
+
+            start: bool = self.current is None and not self.window
+            self.connection.command(("add " if start else "enqueue ") + episode.absolute().as_uri())
+            self.window.append(episode)
+
+    def status(self) -> dict:
+        """
+        Returns VLC's current input URI and playback state, parsed from lines such as "( new input: file:///... )"
+        and "( state playing )".
+        """
+        status: dict = {}
+
+        for line in self.connection.command("status"):
+            line = line.strip("() ")
+
+            if line.startswith("new input:"):
+                status["input"] = line[len("new input:"):].strip()
+            elif line.startswith("state "):
+                status["state"] = line[len("state "):].strip()
+
+        return status
+
+    def find_episode(self, uri: str):
+        """
+        Matches a URI reported by VLC to the current episode or one in the window. VLC may escape characters
+        differently, so URIs are compared unescaped.
+        """
+        if not uri:
+            return None
+
+        uri = unquote(uri)
+        for episode in ([self.current] if self.current else []) + list(self.window):
+            if unquote(episode.absolute().as_uri()) == uri:
+                return episode
+
+        return None
+
+    def record(self, episode: Path):
+        """
+        Writes the marker for an episode's show in the background, so it is kept even if VLC is closed.
+        """
+        Playlist.stage_marker(episode)
+        Playlist.commit_markers(background=True)
+        self.played.append(episode)
+
+
+if __name__ == "__main__":
+    pass
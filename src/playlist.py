@@ -1,22 +1,101 @@
 # Defines the playlist class and its associated methods
 from src.scheme import Scheme
+from src.duration import DurationCache
+from src.export import PlaylistWriter
 from src.helper import PathManager
+from src.library import Library
+from src.markers import MarkerStore
+from src.profiler import Profiler
+from src.sampler import WeightedSampler
 from src.show import Show
 
 from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-import random
+import threading
+
+
+class GenerationReport:
+    """
+    Summary of a playlist generation, including the shows in the scheme that could not be played and why.
+    """
+    # --------------------- Skip Reasons -----------------------------
+    SHOW_NOT_FOUND: str = "Show not found in TV path"
+    NO_EPISODES: str = "Show has no episodes"
+    EPISODE_NOT_FOUND: str = "Current episode marker does not point to an episode"
+
+    def __init__(self):
+        self.skipped_shows: dict = {}
+        self.playable_shows: list = []
+        self.picks: int = 0
+        self.minutes: float = 0
+
+        # Picks budgeted with a duration estimated from the file size, rather than a probed one
+        self.estimated_durations: int = 0
+
+        # Picks whose duration could not be read, and so were budgeted at Show.DEFAULT_DURATION
+        self.unknown_durations: int = 0
+
+        # True if generation stopped at the pick limit rather than the maximum length
+        self.truncated: bool = False
+
+        # True if generation was cancelled before the playlist was full. Episodes picked until then are kept
+        self.cancelled: bool = False
+
+        # Filesystem operations and time per phase, if profiling was enabled during generation
+        self.profile: dict = None
+
+    def as_dict(self) -> dict:
+        return {"skipped_shows": {str(show): reason for show, reason in self.skipped_shows.items()},
+                "playable_shows": [str(show) for show in self.playable_shows],
+                "picks": self.picks,
+                "minutes": self.minutes,
+                "unknown_durations": self.unknown_durations,
+                "estimated_durations": self.estimated_durations,
+                "truncated": self.truncated,
+                "cancelled": self.cancelled,
+                "profile": self.profile}
 
 
 class Playlist:
+    # --------------------- Class Variables -----------------------------
+    # Upper bound on the number of episodes picked in one generation, however short the episodes are
+    MAX_PICKS: int = 5000
+
+    # Threads resolving every show's current episode before sampling. They mostly wait on the disk or the network
+    # share, so there are more of them than there are cores
+    CHECK_WORKERS: int = 16
+
+    # Most upcoming episodes of a show resolved at once. A show's buffer starts at one episode and doubles each time
+    # it runs out, so heavily weighted shows look further ahead without probing extra episodes of the others
+    BUFFER_SIZE: int = 8
+
     def __init__(self, max_length=200):
         self.video_queue: deque = deque()
         self.length: int
         self.max_length: int = max_length
 
-        # This dictionary will take a show path as a key and return a list with an episode and duration in a list
+        # Duration in minutes of each video in the queue, where it could be read from the video
+        self.video_durations: dict = {}
+
+        # Budget with durations estimated from file sizes, so that generation does not wait to open each video
+        self.estimate_durations: bool = PathManager.ESTIMATE_DURATIONS
+
+        # Report from the most recent generation
+        self.report: GenerationReport = GenerationReport()
+
+        # This dictionary will take a show path as a key and return a list with the episode, its index in the show and
+        # whether it has been picked. Shows resolved before sampling are added unpicked, with their current episode.
+        # The episode is the cursor. Its index is only used while it still points at that episode, since the show's
+        # order can be compiled again if the library changes, such as under a LibraryWatcher
         self.next_episode_dict: dict = {}
 
+        # Upcoming episodes of each show from Show.next_episodes, the size of its next refill, and the durations of
+        # picked episodes that came from a buffer, until they are budgeted
+        self.episode_buffers: dict = {}
+        self.buffer_sizes: dict = {}
+        self.buffered_durations: dict = {}
+
     # -------------------- Episode Search Functions -----------------------
     def get_next_episode(self, show_path: Path) -> Show:
         """
@@ -25,84 +104,310 @@ class Playlist:
         """
         # If the show has already been encountered, use the playlist marker rather than reading from file
         try:
-            show: Show = Show(show_path,
-                              self.next_episode_dict[show_path][0],
-                              self.next_episode_dict[show_path][1]
-                              )
-            # Search for the next episode of the show and return it
-            try:
-                show.current_episode = show.find_next_episode(show.current_episode, show.current_episode.parent)
-            except ValueError:
-                pass
+            entry: list = self.next_episode_dict[show_path]
+            show: Show = Show(show_path, episode_index=entry[1])
+            advance: bool = len(entry) < 3 or entry[2]
+
+            if not show.is_current(entry[0]):
+                show.episode_index = show.find_index(entry[0])
+
+                # The episode has been removed, so the episode that followed it is next and has not been played
+                if show.episode_index is None:
+                    show.episode_index = show.find_following_index(entry[0])
+                    advance = False
+
+            # Move the cursor on to the next episode of the show, unless it was only resolved and is yet to be picked
+            if advance:
+                show.find_next_episode()
 
         # If the show hasn't been encountered, return the current episode
         except KeyError:
             show: Show = Show(show_path)
 
+        self.take_buffered(show)
+
         return show
 
+    def take_buffered(self, show: Show):
+        """
+        Takes a show's current episode from its buffer, refilling the buffer with the episodes that follow if it is
+        empty or no longer lines up with the show, so that the durations of several episodes are looked up together.
+        """
+        if show.episode_index is None:
+            return
+
+        buffer: deque = self.episode_buffers.get(show.path)
+
+        if not buffer or buffer[0][1] != show.episode_index or buffer[0][0] != show.current_episode:
+            size: int = self.buffer_sizes.get(show.path, 1)
+            self.buffer_sizes[show.path] = min(size * 2, self.BUFFER_SIZE)
+
+            buffer = deque(show.next_episodes(size, include_current=True, estimate=self.estimate_durations))
+            self.episode_buffers[show.path] = buffer
+
+        episode, index, depth, duration, estimated = buffer.popleft()
+        self.buffered_durations[episode] = (duration, estimated)
+
     # -------------------- Playlist Functions -----------------------
-    def generate_playlist(self, playlist_scheme: Scheme) -> None:
+    def generate_playlist(self, playlist_scheme: Scheme, seed: int = None, progress=None,
+                          cancel: threading.Event = None) -> GenerationReport:
+        """
+        Generates a playlist, adding  up to a maximum number of minutes.
+        Shows that cannot be played are found up front and left out, so every pick adds an episode.
+        :param playlist_scheme: Scheme of shows and frequencies to pick from
+        :param seed: Optional seed for the random selection, so that a playlist can be reproduced
+        :param progress: Optional function called with each episode as it is added, and the playlist length in minutes
+        :param cancel: Optional event that stops generation once set. Episodes already picked are kept
+        :return: Report of the generation, including any shows that were skipped
+        """
+        report = GenerationReport()
+        self.report = report
+
+        with Profiler.session() as profiler:
+            self.fill_playlist(playlist_scheme, report, seed, progress, cancel)
+
+            # Durations read during generation are stamped as used in one write, rather than one per episode
+            DurationCache.get_cache().flush_usage()
+
+            if profiler:
+                report.profile = profiler.report()
+
+        return report
+
+    def fill_playlist(self, playlist_scheme: Scheme, report: GenerationReport, seed: int = None, progress=None,
+                      cancel: threading.Event = None):
         """
-        Generates a playlist, adding  up to a maximum number of minutes
+        Picks episodes until the playlist is full or cancelled, recording the result in the report.
         """
         # Define variables
         queue_length_mins: int = 0
         selected_show: Path
-        timeout_counter: int = 0
+
+        with Profiler.phase(Profiler.MARKER_RESOLUTION):
+            weights: dict = self.check_shows(playlist_scheme, report)
+
+        # Compile the playable shows once, so that each pick does not depend on the number of shows
+        try:
+            with Profiler.phase(Profiler.SAMPLING):
+                sampler = WeightedSampler(list(weights), list(weights.values()), seed=seed)
+        except ValueError:
+            return
 
         # Generate random list of videos
-        while queue_length_mins < self.max_length and timeout_counter <= 50:
-            # Select show from list of shows and user generated frequencies
-            try:
-                selected_show = random.choices(playlist_scheme.data["show_path"].to_list(),
-                                               weights=playlist_scheme.data["frequency"].to_list())
-            except IndexError:
-                continue
+        while queue_length_mins < self.max_length and report.picks < self.MAX_PICKS:
+            if cancel is not None and cancel.is_set():
+                report.cancelled = True
+                break
 
-            # Use .eps text file to determine next episode to play
-            show_path = PathManager.TV_PATH.joinpath(selected_show[0])
+            show = self.pick_episode(sampler)
+            report.picks += 1
 
-            if not show_path.exists():
-                continue
+            # Get duration of video and append to total duration. Only real durations are kept for exporting
+            with Profiler.phase(Profiler.DURATION_PROBING):
+                duration, estimated = self.budget_duration(show, report)
+            queue_length_mins += duration or Show.DEFAULT_DURATION
+            self.video_durations[show.current_episode] = None if estimated else duration
 
-            # Get the next episode of the show
-            show = self.get_next_episode(show_path)
+            # Add path to video queue
+            self.video_queue.append(show.current_episode)
 
-            if not show.current_episode.is_file():
-                timeout_counter += 1
-                continue
+            if progress is not None:
+                progress(show.current_episode, queue_length_mins)
 
-            # Get duration of video and append to total duration
-            queue_length_mins += show.episode_duration
+        report.minutes = queue_length_mins
+        report.truncated = not report.cancelled and queue_length_mins < self.max_length
 
-            # Add path to video queue and add it to the show episode dict
-            self.video_queue.append(show.current_episode)
-            self.next_episode_dict[show_path] = [show.current_episode, show.episode_depth]
+    def stream_playlist(self, playlist_scheme: Scheme, seed: int = None, budget: float = None,
+                        cancel: threading.Event = None):
+        """
+        Yields episodes one at a time for as long as they are wanted, such as for an all-day channel. Nothing is added
+        to the video queue, so memory stays bounded however long the stream runs. Each show carries on from its cursor
+        in next_episode_dict, so a stream can follow on from an earlier generation.
+        Markers are not staged, so call stage_marker for each episode once it has been played.
+        :param playlist_scheme: Scheme of shows and frequencies to pick from
+        :param seed: Optional seed for the random selection, so that a stream can be reproduced
+        :param budget: Optional number of minutes to stop after. Defaults to running until the caller stops
+        :param cancel: Optional event that stops the stream once set
+        :return: Generator of (episode, duration in minutes or None)
+        """
+        report = GenerationReport()
+        self.report = report
+
+        weights: dict = self.check_shows(playlist_scheme, report)
+
+        try:
+            sampler = WeightedSampler(list(weights), list(weights.values()), seed=seed)
+        except ValueError:
+            return
+
+        try:
+            while budget is None or report.minutes < budget:
+                if cancel is not None and cancel.is_set():
+                    report.cancelled = True
+                    return
+
+                show = self.pick_episode(sampler)
+                duration, estimated = self.budget_duration(show, report)
+
+                report.picks += 1
+                report.minutes += duration or Show.DEFAULT_DURATION
+
+                yield show.current_episode, None if estimated else duration
+        finally:
+            DurationCache.get_cache().flush_usage()
+
+    def budget_duration(self, show: Show, report: GenerationReport) -> tuple:
+        """
+        Returns the duration to budget for the current episode of a show, estimating it from the file size if
+        estimate_durations is set, and counts unknown and estimated durations in the report.
+        :return: Duration in minutes or None if it is unknown, and True if it is an estimate
+        """
+        buffered: tuple = self.buffered_durations.pop(show.current_episode, None)
+
+        if buffered is not None:
+            duration, estimated = buffered
+        elif self.estimate_durations:
+            duration, estimated = show.estimated_duration
+        else:
+            duration, estimated = show.known_duration, False
+
+        report.unknown_durations += duration is None
+        report.estimated_durations += estimated and duration is not None
+
+        return duration, estimated
+
+    def pick_episode(self, sampler: WeightedSampler) -> Show:
+        """
+        Picks a show and moves its cursor on to its next episode.
+        :param sampler: Sampler of playable shows
+        :return: Show, with the picked episode as its current episode
+        """
+        # Select show from list of shows and user generated frequencies
+        with Profiler.phase(Profiler.SAMPLING):
+            selected_show = sampler.sample()
+
+        # Get the next episode of the show, using the marker store the first time the show is picked
+        show_path: Path = PathManager.TV_PATH.joinpath(selected_show)
+        with Profiler.phase(Profiler.MARKER_RESOLUTION):
+            show: Show = self.get_next_episode(show_path)
+
+        self.next_episode_dict[show_path] = [show.current_episode, show.episode_index, True]
+        return show
+
+    def check_shows(self, playlist_scheme: Scheme, report: GenerationReport) -> dict:
+        """
+        Checks in parallel which shows in the scheme can be played, recording the reason for any that cannot.
+        The current episode of every playable show is resolved at the same time and added to next_episode_dict, so
+        that picking episodes afterwards does not have to read any markers.
+        :param playlist_scheme: Scheme of shows and frequencies
+        :param report: Report to record playable and skipped shows in
+        :return: Dictionary of playable shows and their frequencies
+        """
+        candidates: dict = {}
+        for show, frequency in zip(playlist_scheme.data.column("show_path"),
+                                   playlist_scheme.data.column("frequency")):
+            if WeightedSampler.to_weight(frequency) > 0:
+                candidates[show] = frequency
+
+        if not candidates:
+            return {}
+
+        with ThreadPoolExecutor(max_workers=min(self.CHECK_WORKERS, len(candidates))) as executor:
+            resolved: list = list(executor.map(self.resolve_show, candidates))
+
+        weights: dict = {}
+        for (show, frequency), (reason, resolved_show) in zip(candidates.items(), resolved):
+            if reason:
+                report.skipped_shows[show] = reason
+            else:
+                report.playable_shows.append(show)
+                weights[show] = frequency
+
+            if resolved_show is not None:
+                self.next_episode_dict[PathManager.TV_PATH.joinpath(show)] = [resolved_show.current_episode,
+                                                                              resolved_show.episode_index, False]
+
+        return weights
+
+    def resolve_show(self, selected_show) -> tuple:
+        """
+        Checks that a show can be played, resolving its current episode from the marker store.
+        :param selected_show: Show path relative to TV_PATH, as stored in a scheme
+        :return: The reason the show cannot be played or None if it can, and the resolved Show if it can and is not
+                 already in the playlist
+        """
+        show_path: Path = PathManager.TV_PATH.joinpath(selected_show)
+
+        if not Library.get_library().exists(show_path):
+            return GenerationReport.SHOW_NOT_FOUND, None
+
+        # Shows already in the playlist carry on from their playlist marker
+        if show_path in self.next_episode_dict:
+            return None, None
+
+        show: Show = Show(show_path)
+
+        if not len(show.episode_order):
+            return GenerationReport.NO_EPISODES, None
+
+        if show.episode_index is None:
+            return GenerationReport.EPISODE_NOT_FOUND, None
+
+        return None, show
 
     def dequeue_playlist(self) -> Path:
         """
-        Manages simultaneous updates of video_queues and playlist backlog file. Removes one video from the queue.
+        Manages simultaneous updates of video_queues and episode markers. Removes one video from the queue.
+        The show's marker is staged, and is written along with the rest of the playlist by commit_markers.
         """
         # Pop and return front of queue. If queue is empty, return None
         try:
             video: Path = self.video_queue.popleft()
-
-            # Set start point for iteratively setting .eps file through directory
-            path = video
-
-            # Get limiter to stop shows from saving over .eps file in TV_PATH
-            show_directories = [path for path in PathManager.TV_PATH.iterdir() if path.is_dir()]
-
-            while path != PathManager.TV_PATH and path not in show_directories:
-                Show.write_next_episode(path)
-                path = path.parent
+            self.stage_marker(video)
 
         except IndexError:
             video = None
 
         return video
 
+    @staticmethod
+    def stage_marker(video: Path):
+        """
+        Stages a video as its show's current episode, to be written by commit_markers.
+        """
+        library: Library = Library.get_library()
+        MarkerStore.get_store(library).stage(library.show_path(video), video)
+
+    @staticmethod
+    def commit_markers(background: bool = False):
+        """
+        Writes the markers of every dequeued video in a single transaction.
+        :param background: Write them on a background thread instead of waiting. Use wait_for_markers to collect errors
+        :return: Number of shows whose markers were written, or a Future of it when written in the background
+        """
+        if background:
+            return MarkerStore.get_store().commit_async()
+
+        with Profiler.phase(Profiler.MARKER_COMMIT):
+            return MarkerStore.get_store().commit()
+
+    @staticmethod
+    def wait_for_markers(timeout: float = None) -> list:
+        """
+        Waits for markers being written in the background.
+        :return: Errors from any writes that failed
+        """
+        return MarkerStore.get_store().wait_for_commits(timeout)
+
+    def export_playlist(self, path: Path) -> int:
+        """
+        Writes the queue to a playlist file without removing anything from it. The format is chosen by file extension.
+        :param path: File to write, ending in .m3u8, .m3u or .xspf
+        :return: Number of videos written
+        """
+        with Profiler.phase(Profiler.PLAYLIST_WRITE), PlaylistWriter.open(path) as writer:
+            return writer.add_all(self.video_queue, self.video_durations)
+
     def clear_playlist(self):
         """
         Removes all videos from current playlist queue and backlog (.playlist.txt)
@@ -110,7 +415,11 @@ class Playlist:
         """
         # Clear playlist object
         self.video_queue = deque()
+        self.video_durations = dict()
         self.next_episode_dict = dict()
+        self.episode_buffers = dict()
+        self.buffer_sizes = dict()
+        self.buffered_durations = dict()
 
 
 if __name__ == "__main__":
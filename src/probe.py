@@ -0,0 +1,312 @@
+# Reads video durations from container headers, falling back to TinyTag and ffprobe for anything else
+from src.profiler import Profiler
+
+from pathlib import Path
+import shutil
+import struct
+import subprocess
+import threading
+
+
+class HeaderProbe:
+    """
+    Reads the duration from the headers of MP4/MOV and Matroska/WebM files. Only the headers are read, seeking past
+    everything else, so a probe costs a few small reads however large the file is.
+    """
+    # Matroska element IDs
+    EBML: int = 0x1A45DFA3
+    SEGMENT: int = 0x18538067
+    INFO: int = 0x1549A966
+    CLUSTER: int = 0x1F43B675
+    TIMECODE_SCALE: int = 0x2AD7B1
+    DURATION: int = 0x4489
+
+    # Stop looking for the Matroska Info element after this many bytes of other elements, and never read a header
+    # element larger than this, since a corrupt size could otherwise read the whole file
+    MAX_HEADER_BYTES: int = 1 << 20
+
+    def duration(self, video: Path):
+        """
+        :return: Duration in seconds, or None if the file is not a supported container or has no duration
+        """
+        try:
+            with open(video, "rb") as file:
+                start: bytes = self.read(file, 12)
+                file.seek(0)
+
+                if start[:4] == struct.pack(">I", self.EBML):
+                    return self.matroska_duration(file)
+                if start[4:8] == b"ftyp":
+                    return self.mp4_duration(file)
+        except (OSError, ValueError, struct.error):
+            return None
+
+        return None
+
+    # --------------------- MP4 ----------------------------
+    @classmethod
+    def mp4_duration(cls, file):
+        """
+        Finds moov/mvhd by walking box headers, and reads its timescale and duration.
+        """
+        moov = cls.find_box(file, b"moov", file.seek(0, 2))
+        if moov is None:
+            return None
+
+        mvhd = cls.find_box(file, b"mvhd", moov[1], moov[0])
+        if mvhd is None:
+            return None
+
+        file.seek(mvhd[0])
+        version: int = cls.read(file, 4)[0]
+
+        if version == 1:
+            timescale, duration = struct.unpack(">16xIQ", cls.read(file, 28))
+            unknown: int = 0xFFFFFFFFFFFFFFFF
+        else:
+            timescale, duration = struct.unpack(">8xII", cls.read(file, 16))
+            unknown: int = 0xFFFFFFFF
+
+        if not timescale or not duration or duration == unknown:
+            return None
+
+        return duration / timescale
+
+    @classmethod
+    def find_box(cls, file, box_type: bytes, end: int, start: int = 0):
+        """
+        Finds a box among the boxes between start and end.
+        :return: Start and end offsets of the box's contents, or None if it is not found
+        """
+        position: int = start
+
+        while position + 8 <= end:
+            file.seek(position)
+            size, found_type = struct.unpack(">I4s", cls.read(file, 8))
+            header: int = 8
+
+            if size == 1:
+                size = struct.unpack(">Q", cls.read(file, 8))[0]
+                header = 16
+            elif size == 0:
+                size = end - position
+
+            if size < header:
+                return None
+
+            if found_type == box_type:
+                return position + header, min(position + size, end)
+
+            position += size
+
+        return None
+
+    # --------------------- Matroska ----------------------------
+    @classmethod
+    def matroska_duration(cls, file):
+        """
+        Reads Segment/Info for the duration, which Matroska stores in units of the timecode scale.
+        """
+        element_id, size = cls.read_element(file)
+        if size is None or size > cls.MAX_HEADER_BYTES:
+            return None
+        file.seek(size, 1)
+
+        element_id, size = cls.read_element(file)
+        if element_id != cls.SEGMENT:
+            return None
+
+        # The segment size may be unknown for files that were streamed, so children are read until Info is found
+        skipped: int = 0
+        while skipped < cls.MAX_HEADER_BYTES:
+            element_id, size = cls.read_element(file)
+
+            if element_id == cls.CLUSTER or size is None or size > cls.MAX_HEADER_BYTES:
+                return None
+
+            if element_id == cls.INFO:
+                return cls.read_info(file, size)
+
+            file.seek(size, 1)
+            skipped += size
+
+        return None
+
+    @classmethod
+    def read_info(cls, file, size: int):
+        data: bytes = cls.read(file, size)
+        timecode_scale: int = 1000000
+        duration: float = None
+        position: int = 0
+
+        while position < len(data):
+            element_id, length, position = cls.parse_element(data, position)
+            if length is None:
+                break
+
+            value: bytes = data[position:position + length]
+            if len(value) < length:
+                break
+            position += length
+
+            if element_id == cls.TIMECODE_SCALE:
+                timecode_scale = int.from_bytes(value, "big")
+            elif element_id == cls.DURATION and length in [4, 8]:
+                duration = struct.unpack(">f" if length == 4 else ">d", value)[0]
+
+        if not duration or duration < 0:
+            return None
+
+        return duration * timecode_scale / 1e9
+
+    @classmethod
+    def read_element(cls, file) -> tuple:
+        """
+        Reads an element header from the file.
+        :return: Element ID and size, with a size of None if it is unknown
+        """
+        data: bytes = file.read(12)
+        element_id, size, position = cls.parse_element(data, 0)
+        if position > len(data):
+            raise ValueError("Truncated EBML element")
+        file.seek(position - len(data), 1)
+        return element_id, size
+
+    @staticmethod
+    def read(file, size: int) -> bytes:
+        """
+        Reads exactly size bytes, so that a truncated file fails like any other unreadable header.
+        """
+        data: bytes = file.read(size)
+        if len(data) < size:
+            raise ValueError("Truncated header")
+
+        return data
+
+    @staticmethod
+    def parse_element(data: bytes, position: int) -> tuple:
+        """
+        Parses the variable length ID and size of an EBML element.
+        :return: Element ID, size and the position of the element's data
+        """
+        if position >= len(data) or not data[position]:
+            raise ValueError("Invalid EBML element")
+
+        id_length: int = 8 - data[position].bit_length() + 1
+        element_id: int = int.from_bytes(data[position:position + id_length], "big")
+        position += id_length
+
+        if position >= len(data) or not data[position]:
+            raise ValueError("Invalid EBML element")
+
+        size_length: int = 8 - data[position].bit_length() + 1
+        size: int = int.from_bytes(data[position:position + size_length], "big")
+        size &= (1 << (7 * size_length)) - 1
+
+        # All ones means the size is unknown
+        if size == (1 << (7 * size_length)) - 1:
+            size = None
+
+        return element_id, size, position + size_length
+
+
+class TinyTagProbe:
+    """
+    Reads durations with TinyTag, which supports audio formats and some containers HeaderProbe does not.
+    """
+    def duration(self, video: Path):
+        # TinyTag is only imported once a video actually needs it, to keep start up fast
+        try:
+            from tinytag import TinyTag
+        except ImportError:
+            return None
+
+        try:
+            return TinyTag.get(video.as_posix()).duration or None
+        except Exception:
+            return None
+
+
+class FFProbePool:
+    """
+    Reads durations with ffprobe, which understands almost anything. At most WORKERS ffprobe processes run at once,
+    however many threads are probing.
+    """
+    WORKERS: int = 4
+    TIMEOUT: float = 15
+
+    def __init__(self, executable: str = None, workers: int = WORKERS):
+        self.executable: str = executable or shutil.which("ffprobe")
+        self.slots = threading.BoundedSemaphore(workers)
+
+    @classmethod
+    def available(cls) -> bool:
+        return shutil.which("ffprobe") is not None
+
+    def duration(self, video: Path):
+        if not self.executable:
+            return None
+
+        with self.slots:
+            try:
+                result = subprocess.run([self.executable, "-v", "error", "-show_entries", "format=duration",
+                                         "-of", "default=noprint_wrappers=1:nokey=1", video.as_posix()],
+                                        capture_output=True, text=True, timeout=self.TIMEOUT)
+                return float(result.stdout.strip()) or None
+            except (OSError, ValueError, subprocess.SubprocessError):
+                return None
+
+
+class DurationProbe:
+    """
+    Tries each backend in turn until one finds a duration. Durations that none of them can read are UNKNOWN, rather
+    than a guess, so that callers can decide what to assume.
+    """
+    # --------------------- Class Variables -----------------------------
+    UNKNOWN = None
+    PARALLEL_PROBES: int = 8
+
+    _probe = None
+
+    def __init__(self, backends: list = None):
+        """
+        :param backends: Objects with a duration(video) method returning seconds or None. Defaults to the header
+                         reader, then TinyTag, then ffprobe if it is installed
+        """
+        if backends is None:
+            backends = [HeaderProbe(), TinyTagProbe()] + ([FFProbePool()] if FFProbePool.available() else [])
+
+        self.backends: list = backends
+
+    @classmethod
+    def get_probe(cls):
+        """
+        Returns the shared probe with the default backends.
+        """
+        if cls._probe is None:
+            cls._probe = DurationProbe()
+
+        return cls._probe
+
+    def probe(self, video: Path):
+        """
+        Reads the duration of a video.
+        :param video: Path to the video
+        :return: Duration in minutes, or UNKNOWN if no backend could read it
+        """
+        with Profiler.operation("probe"):
+            for backend in self.backends:
+                # A backend that fails on a corrupt file should not stop the others from trying
+                try:
+                    seconds = backend.duration(video)
+                except Exception:
+                    continue
+
+                if seconds:
+                    return seconds / 60
+
+        return self.UNKNOWN
+
+
+if __name__ == "__main__":
+    pass
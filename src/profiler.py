@@ -0,0 +1,131 @@
+# Opt-in counting and timing of filesystem operations, grouped by the phase of generation they happen in
+from contextlib import contextmanager
+import threading
+import time
+
+
+class Profiler:
+    # --------------------- Class Variables -----------------------------
+    # Profiling is off unless enabled, in which case each generation or launch is recorded in its own session
+    enabled: bool = False
+    current = None
+
+    # Phases used by Scheme, Playlist and Show
+    SCHEME_LOAD: str = "scheme_load"
+    MARKER_RESOLUTION: str = "marker_resolution"
+    SAMPLING: str = "sampling"
+    DURATION_PROBING: str = "duration_probing"
+    MARKER_COMMIT: str = "marker_commit"
+    PLAYLIST_WRITE: str = "playlist_write"
+    OTHER: str = "other"
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start: float = time.perf_counter()
+
+        # Each phase records the time spent in it, excluding any phases nested inside it, and its operations
+        self.phases: dict = {}
+        self.stack: list = []
+
+    @classmethod
+    def enable(cls, enabled: bool = True):
+        cls.enabled = enabled
+
+    @classmethod
+    @contextmanager
+    def session(cls):
+        """
+        Starts recording a new session if profiling is enabled. Sessions started inside another session add to it.
+        :return: The Profiler recording the session, or None if profiling is disabled
+        """
+        if not cls.enabled or cls.current is not None:
+            yield cls.current
+            return
+
+        cls.current = Profiler()
+        try:
+            yield cls.current
+        finally:
+            cls.current = None
+
+    @classmethod
+    @contextmanager
+    def phase(cls, name: str):
+        """
+        Times a phase. Time spent in phases nested inside it is only counted against the nested phase.
+        :param name: Name of the phase
+        """
+        profiler = cls.current
+        if profiler is None:
+            yield
+            return
+
+        now: float = time.perf_counter()
+        with profiler.lock:
+            if profiler.stack:
+                profiler.pause(profiler.stack[-1], now)
+            profiler.stack.append([name, now])
+            profiler.get_phase(name)["calls"] += 1
+
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            with profiler.lock:
+                profiler.pause(profiler.stack.pop(), now)
+                if profiler.stack:
+                    profiler.stack[-1][1] = now
+
+    @classmethod
+    @contextmanager
+    def operation(cls, name: str):
+        """
+        Counts and times a filesystem operation against the current phase.
+        :param name: Name of the operation, such as stat or probe
+        """
+        profiler = cls.current
+        if profiler is None:
+            yield
+            return
+
+        start: float = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds: float = time.perf_counter() - start
+
+            with profiler.lock:
+                phase: str = profiler.stack[-1][0] if profiler.stack else cls.OTHER
+                operation: dict = profiler.get_phase(phase)["operations"].setdefault(name, {"count": 0, "seconds": 0})
+                operation["count"] += 1
+                operation["seconds"] += seconds
+
+    # --------------------- Report ----------------------------
+    def get_phase(self, name: str) -> dict:
+        return self.phases.setdefault(name, {"seconds": 0, "calls": 0, "operations": {}})
+
+    def pause(self, frame: list, now: float):
+        self.get_phase(frame[0])["seconds"] += now - frame[1]
+
+    def report(self) -> dict:
+        """
+        Returns the phases and operations recorded so far, with operation totals across all phases.
+        """
+        with self.lock:
+            phases: dict = {name: {"seconds": phase["seconds"], "calls": phase["calls"],
+                                   "operations": {operation: dict(totals)
+                                                  for operation, totals in phase["operations"].items()}}
+                            for name, phase in self.phases.items()}
+
+        operations: dict = {}
+        for phase in phases.values():
+            for name, totals in phase["operations"].items():
+                total: dict = operations.setdefault(name, {"count": 0, "seconds": 0})
+                total["count"] += totals["count"]
+                total["seconds"] += totals["seconds"]
+
+        return {"total_seconds": time.perf_counter() - self.start, "phases": phases, "operations": operations}
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,128 @@
+# Weighted random selection of shows from a scheme
+import random
+
+
+class WeightedSampler:
+    # --------------------- Class Variables -----------------------------
+    BATCH_SIZE: int = 64
+
+    def __init__(self, items: list, weights: list, seed: int = None, batch_size: int = BATCH_SIZE):
+        """
+        Compiles a list of items and weights into an alias table, so that each pick costs the same regardless of the
+        number of items. Picks are drawn in batches, using NumPy if it is available.
+        :param items: Items to pick from
+        :param weights: Relative weight of each item. Items with a weight of zero or less are never picked
+        :param seed: Optional seed, so that the same scheme and seed always give the same picks
+        :param batch_size: Number of picks to draw at a time
+        """
+        weights = [self.to_weight(weight) for weight in weights]
+
+        # Items with no weight are dropped from the table entirely
+        self.items: list = [item for item, weight in zip(items, weights) if weight > 0]
+        weights = [weight for weight in weights if weight > 0]
+
+        if not self.items:
+            raise ValueError("At least one item must have a weight greater than zero.")
+
+        self.probability, self.alias = self.build_alias_table(weights)
+        self.batch_size: int = batch_size
+        self.batch: list = []
+
+        # NumPy is optional, and is only imported once a sampler is needed
+        try:
+            import numpy
+            self.numpy = numpy
+        except ImportError:
+            self.numpy = None
+
+        if self.numpy is not None:
+            self.generator = self.numpy.random.default_rng(seed)
+            self.probability = self.numpy.array(self.probability)
+            self.alias = self.numpy.array(self.alias)
+        else:
+            self.generator = random.Random(seed)
+
+    def __len__(self):
+        return len(self.items)
+
+    # --------------------- Sampling Functions ----------------------------
+    def sample(self):
+        """
+        Returns a single weighted random item, refilling the batch of picks when it runs out.
+        """
+        if not self.batch:
+            self.batch = self.sample_batch(self.batch_size)
+            self.batch.reverse()
+
+        return self.batch.pop()
+
+    def sample_batch(self, count: int) -> list:
+        """
+        Draws a number of weighted random items at once.
+        :param count: Number of items to draw
+        :return: List of items
+        """
+        size: int = len(self.items)
+
+        if self.numpy is not None:
+            columns = self.generator.integers(0, size, count)
+            coins = self.generator.random(count)
+            indices = self.numpy.where(coins < self.probability[columns], columns, self.alias[columns])
+        else:
+            indices = []
+            for _ in range(count):
+                column: int = self.generator.randrange(size)
+                indices.append(column if self.generator.random() < self.probability[column] else self.alias[column])
+
+        return [self.items[index] for index in indices]
+
+    # -------------------- Static Methods -----------------------
+    @staticmethod
+    def build_alias_table(weights: list):
+        """
+        Builds the probability and alias columns for Vose's alias method. Each column holds the chance of keeping
+        that column's own item, with the remainder going to its alias.
+        :param weights: Positive weights
+        :return: Tuple of probability and alias lists
+        """
+        size: int = len(weights)
+        total: float = sum(weights)
+        scaled: list = [weight * size / total for weight in weights]
+
+        probability: list = [1.0] * size
+        alias: list = list(range(size))
+
+        small: list = [index for index, weight in enumerate(scaled) if weight < 1]
+        large: list = [index for index, weight in enumerate(scaled) if weight >= 1]
+
+        while small and large:
+            less, more = small.pop(), large.pop()
+            probability[less] = scaled[less]
+            alias[less] = more
+
+            # Give the remainder of the small column to the large item, and requeue it based on what is left
+            scaled[more] -= 1 - scaled[less]
+            if scaled[more] < 1:
+                small.append(more)
+            else:
+                large.append(more)
+
+        # Any remaining columns are full, allowing for floating point error
+        return probability, alias
+
+    @staticmethod
+    def to_weight(value) -> float:
+        """
+        Converts a frequency from a scheme into a weight. Blank or invalid frequencies count as zero.
+        """
+        try:
+            weight = float(value)
+        except (TypeError, ValueError):
+            return 0
+
+        # NaN is not equal to itself, and is treated as blank
+        return weight if weight == weight else 0
+
+
+if __name__ == "__main__":
+    pass
@@ -1,31 +1,128 @@
 # Playlist scheme and related methods
 from src.helper import PathManager
+from src.library import Library
+from src.profiler import Profiler
 
-import pandas as pd
 from pathlib import Path
+import csv
+
+
+class SchemeData:
+    """
+    Rows of a scheme, keyed by row index, with a show_path and frequency column. Reads and writes the same CSV format
+    as pandas, so pandas is only needed to convert to and from a DataFrame.
+    """
+    COLUMNS: list = ["show_path", "frequency"]
+
+    def __init__(self, rows: dict = None):
+        self.rows: dict = rows if rows is not None else {}
+
+    def __len__(self):
+        return len(self.rows)
+
+    @property
+    def index(self) -> list:
+        return list(self.rows)
+
+    def column(self, column: str) -> list:
+        return [row[column] for row in self.rows.values()]
+
+    def get(self, index, column: str):
+        return self.rows[index][column]
+
+    def set(self, index, column: str, value):
+        self.rows[index][column] = value
+
+    def items(self):
+        return self.rows.items()
+
+    # --------------------- File Functions ----------------------------
+    @classmethod
+    def read_csv(cls, path: Path):
+        """
+        Reads a scheme CSV, with the row index in the first column.
+        :param path: Path to the CSV
+        :return: SchemeData
+        """
+        rows: dict = {}
+        with Profiler.operation("scheme_read"), open(path, "r", newline="") as file:
+            reader = csv.reader(file)
+            header: list = next(reader, [])
+
+            for line in reader:
+                if not line:
+                    continue
+
+                row: dict = dict(zip(header[1:], line[1:]))
+                rows[cls.to_number(line[0])] = {"show_path": row.get("show_path", ""),
+                                                "frequency": cls.to_number(row.get("frequency", ""))}
+
+        return SchemeData(rows)
+
+    def to_csv(self, path: Path):
+        with Profiler.operation("scheme_write"), open(path, "w", newline="") as file:
+            writer = csv.writer(file, lineterminator="\n")
+            writer.writerow([""] + self.COLUMNS)
+
+            for index, row in self.rows.items():
+                frequency = row["frequency"]
+                writer.writerow([index, row["show_path"], "" if frequency is None else frequency])
+
+    # --------------------- Pandas Conversion ----------------------------
+    @classmethod
+    def from_dataframe(cls, data):
+        return SchemeData({index: {"show_path": row["show_path"], "frequency": row["frequency"]}
+                           for index, row in data.to_dict(orient="index").items()})
+
+    def to_dataframe(self):
+        """
+        Converts the rows into a pandas DataFrame. Requires the optional pandas dependency.
+        """
+        import pandas as pd
+
+        return pd.DataFrame.from_dict(self.rows, orient="index", columns=self.COLUMNS)
+
+    # -------------------- Static Methods -----------------------
+    @staticmethod
+    def to_number(value: str):
+        """
+        Converts a CSV value to an int or float where possible. Blank values become None.
+        """
+        if value == "":
+            return None
+
+        for number_type in [int, float]:
+            try:
+                return number_type(value)
+            except ValueError:
+                pass
+
+        return value
 
 
 class Scheme:
-    def __init__(self, title, data=pd.DataFrame(columns=['show_path', 'frequency'])):
+    def __init__(self, title, data=None):
         self.title: str = title
-        self.data: pd.DataFrame = data
+
+        # DataFrames are accepted for compatibility, but are stored as SchemeData
+        if data is None:
+            data = SchemeData()
+        elif not isinstance(data, SchemeData):
+            data = SchemeData.from_dataframe(data)
+
+        self.data: SchemeData = data
 
     @classmethod
     def new_playlist_scheme(cls, file_name: str):
-        # Grab folder name for each video
-        show_folders: list = [folder for folder in PathManager.TV_PATH.iterdir()
-                              if folder.suffix not in [".csv", ".txt"]]
-
-        # Create and populate dataframe
-        show_folder_df: pd.DataFrame = pd.DataFrame(columns=["show_path", "frequency"])
-        show_folder_df["show_path"] = show_folders
-        show_folder_df["frequency"] = show_folder_df["frequency"].fillna(1)
+        # Grab folder name for each show, and each video in the root of the TV_PATH
+        library: Library = Library.get_library()
+        show_folders: list = library.shows() + library.list_directory(PathManager.TV_PATH, include_dirs=False)
 
-        # Make relative to TV_PATH and remove playlist row
-        show_folder_df["show_path"] = show_folder_df["show_path"].apply(lambda x: x.relative_to(PathManager.TV_PATH))
-        show_folder_df = show_folder_df[show_folder_df["show_path"] != Path('.scheme')]
+        # Make relative to TV_PATH, with every show included once
+        data = SchemeData({index: {"show_path": folder.relative_to(PathManager.TV_PATH).as_posix(), "frequency": 1}
+                           for index, folder in enumerate(show_folders)})
 
-        return Scheme(file_name, show_folder_df)
+        return Scheme(file_name, data)
 
     @classmethod
     def load_playlist_scheme(cls, file_name: str):
@@ -34,25 +131,140 @@ class Scheme:
         """
         # Declare variables
         scheme: Scheme
-        data: pd.DataFrame
+        data: SchemeData
 
-        try:
-            data = pd.read_csv(PathManager.TV_PATH.as_posix() + "/.scheme/" + file_name + ".csv", index_col=0)
-            scheme = Scheme(file_name, data)
-        except FileNotFoundError:
-            scheme = cls.new_playlist_scheme(file_name)
+        with Profiler.phase(Profiler.SCHEME_LOAD):
+            try:
+                data = SchemeData.read_csv(cls.scheme_path(file_name))
+                scheme = Scheme(file_name, data)
+            except FileNotFoundError:
+                scheme = cls.new_playlist_scheme(file_name)
 
         return scheme
 
     def refresh_scheme(self):
-        self.data = pd.read_csv(PathManager.TV_PATH.as_posix() + "/.scheme/" + self.title + ".csv", index_col=0)
+        with Profiler.phase(Profiler.SCHEME_LOAD):
+            self.data = SchemeData.read_csv(self.scheme_path(self.title))
+
+    def show_paths(self) -> list:
+        """
+        Returns the shows in the scheme that are in the library. Videos in the root of the library share the TV_PATH.
+        """
+        library: Library = Library.get_library()
+        show_paths: list = []
+
+        for show in self.data.column("show_path"):
+            path: Path = PathManager.TV_PATH.joinpath(show)
+
+            if library.exists(path) and library.show_path(path) not in show_paths:
+                show_paths.append(library.show_path(path))
+
+        return show_paths
 
     def save_scheme(self):
         save_path = PathManager.TV_PATH.joinpath(".scheme")
         if not save_path.exists():
             save_path.mkdir()
 
-        self.data.to_csv(PathManager.TV_PATH.as_posix() + "/.scheme/" + self.title + ".csv")
+        self.data.to_csv(self.scheme_path(self.title))
+
+    @staticmethod
+    def scheme_path(file_name: str) -> Path:
+        return PathManager.TV_PATH.joinpath(".scheme", file_name + ".csv")
+
+
+class SchemeEditor:
+    """
+    Pages through the rows of a scheme for editing, so that only a page of rows needs widgets however many shows the
+    scheme has. Edited frequencies are kept apart from the scheme until they are applied, and only rows whose
+    frequency changed are written back.
+    """
+    # --------------------- Class Variables -----------------------------
+    PAGE_SIZE: int = 25
+
+    def __init__(self, scheme: Scheme, page_size: int = PAGE_SIZE):
+        self.scheme: Scheme = scheme
+        self.page_size: int = page_size
+        self.page: int = 0
+
+        # Row indexes matching the filter, in scheme order
+        self.filter_text: str = ""
+        self.matches: list = scheme.data.index
+
+        # Frequencies entered by the user, as text, keyed by row index
+        self.edits: dict = {}
+
+    # --------------------- Paging ----------------------------
+    @property
+    def page_count(self) -> int:
+        return max(1, -(-len(self.matches) // self.page_size))
+
+    def set_filter(self, text: str):
+        """
+        Shows only the rows whose show path contains the text, ignoring case, starting from the first page.
+        """
+        self.filter_text = text.strip().lower()
+        self.matches = [index for index, row in self.scheme.data.items()
+                        if self.filter_text in str(row["show_path"]).lower()]
+        self.page = 0
+
+    def set_page(self, page: int):
+        self.page = min(max(page, 0), self.page_count - 1)
+
+    def visible_rows(self) -> list:
+        """
+        Returns the rows on the current page, with any edited frequencies in place of the saved ones.
+        :return: List of (row index, show path, frequency text)
+        """
+        start: int = self.page * self.page_size
+        return [(index, self.scheme.data.get(index, "show_path"), self.frequency_text(index))
+                for index in self.matches[start:start + self.page_size]]
+
+    # --------------------- Editing ----------------------------
+    def frequency_text(self, index) -> str:
+        if index in self.edits:
+            return self.edits[index]
+
+        frequency = self.scheme.data.get(index, "frequency")
+        return "" if frequency is None else str(frequency)
+
+    def set_frequency(self, index, text: str):
+        """
+        Records a frequency entered for a row. Entering the saved frequency again drops the edit.
+        """
+        frequency = self.scheme.data.get(index, "frequency")
+
+        if text == ("" if frequency is None else str(frequency)):
+            self.edits.pop(index, None)
+        else:
+            self.edits[index] = text
+
+    def apply(self) -> int:
+        """
+        Writes the edited frequencies into the scheme. Blank frequencies are saved as 0.
+        :return: Number of rows changed
+        """
+        for index, text in self.edits.items():
+            self.scheme.data.set(index, "frequency", SchemeData.to_number(text) if text else 0)
+
+        changed: int = len(self.edits)
+        self.edits = {}
+
+        return changed
+
+    def discard(self):
+        self.edits = {}
+
+    def reload(self):
+        """
+        Drops any edits and rereads the scheme from file, keeping the filter.
+        :raises FileNotFoundError: If the scheme has not been saved
+        """
+        self.scheme.refresh_scheme()
+        self.edits = {}
+        page: int = self.page
+        self.set_filter(self.filter_text)
+        self.set_page(page)
 
 
 if __name__ == "__main__":
@@ -1,26 +1,38 @@
 # From src
-from tinytag import TinyTag
-
+from src.duration import DurationCache
 from src.helper import PathManager
+from src.library import Library
+from src.markers import MarkerStore
+from src.probe import DurationProbe
+from src.profiler import Profiler
 
 # From libraries
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import re
 
 
 class Show:
-    def __init__(self, show_path: Path, episode_path: Path = None, depth: int = 0):
-        if show_path.is_file():
+    # --------------------- Class Variables -----------------------------
+    # Minutes assumed for videos whose duration cannot be read
+    DEFAULT_DURATION: int = 20
+
+    def __init__(self, show_path: Path, episode_path: Path = None, episode_index: int = None):
+        if Library.get_library().is_episode(show_path):
             self.path: Path = show_path.parent
         else:
             self.path: Path = show_path
 
-        # Current episode details. Depth stored to facilitate finding next episode if end of directory reached
-        self.episode_depth: int = depth
-        try:
-            self.current_episode: Path = episode_path
-        except ValueError:
-            self.current_episode = self.get_current_episode(self.path)
+        # Flattened episode order of the show. The current episode is stored as an index into it
+        self.episode_order = Library.get_library().episode_order(self.path)
+        self.episode_index: int = None
+
+        if episode_index is not None:
+            self.episode_index = episode_index
+        elif episode_path is not None:
+            self.current_episode = episode_path
+        else:
+            self.get_current_episode(self.path)
 
     # --------------------- Search Functions ----------------------------
     @staticmethod
@@ -54,209 +66,189 @@ class Show:
 
     # -------------------- Show Properties --------------------------------
     @property
-    def current_episode(self):
-        try:
-            return self._current_episode
-        except AttributeError:
+    def current_episode(self) -> Path:
+        if self.episode_index is None:
             return Path()
 
+        return self.episode_order.episodes[self.episode_index]
+
     @current_episode.setter
     def current_episode(self, value: Path):
         if isinstance(value, Path):
-            if value.exists() and value.is_file() and value.suffix in PathManager.VIDEO_EXTENSIONS:
-                self._current_episode = value
-            else:
-                self._current_episode = Path()
-
+            self.episode_index = self.find_index(value)
         else:
             raise ValueError("Invalid Path.")
 
     @property
-    def episode_duration(self):
-        try:
-            tag = TinyTag.get(self.current_episode.as_posix())
-        except:
-            return 20
+    def known_duration(self):
+        """
+        Duration of the current episode in minutes, or None if it cannot be read from the video.
+        Durations are cached by path, size and modified time so that unchanged videos are only opened once
+        """
+        return DurationCache.get_cache().duration(self.current_episode)
 
-        if tag.duration:
-            return tag.duration / 60
+    @property
+    def estimated_duration(self) -> tuple:
+        """
+        Duration of the current episode in minutes without opening the video, predicted from its size if it has not been
+        probed yet, and whether it is an estimate. See DurationCache.estimate
+        """
+        return DurationCache.get_cache().estimate(self.current_episode)
 
-        # If data not available on video length, add 20 mins to ensure we do not infinite loop
-        else:
-            return 20
+    def is_current(self, episode: Path) -> bool:
+        """
+        Whether the current index still points at an episode, since the show's order may have been compiled again.
+        """
+        return self.episode_index is not None and self.episode_index < len(self.episode_order) and \
+            self.episode_order.episodes[self.episode_index] == episode
 
     # -------------------- Episode Search Functions -----------------------
+    def find_following_index(self, path: Path):
+        """
+        Returns the position of an episode, or of the episode that followed it if it is no longer in the show.
+        :param path: Episode of the show, which may since have been renamed or deleted
+        :return: Index into the episode order, or None if the path is outside the library or the show has no episodes
+        """
+        try:
+            key: str = Library.get_library().relative(path)
+        except ValueError:
+            return None
+
+        return self.episode_order.find_following(key)
+
+    def find_index(self, path: Path):
+        """
+        Returns the position of an episode in the show, or of the first episode at or after a folder in the show.
+        :param path: Episode or folder within the show
+        :return: Index into the episode order, or None if the path is not part of the show
+        """
+        try:
+            key: str = Library.get_library().relative(path)
+        except ValueError:
+            return None
+
+        return self.episode_order.find(key)
 
     def get_first_episode(self, search_path: Path, write=True) -> Path:
         """
-        Returns the first episode of a show, or of a subfolder. If show is arranged into seasons, searches recursively.
+        Returns the first episode of a show, or of a subfolder. If the subfolder is empty, the episode after it is used.
         :param write: Typically, this is only false in order to preserve previous episodes in the instance
         that a user does not load Playlist into VLC media player. This will also be written again when loading into VLC.
         :param search_path: Path to initiate search for episode
         """
-        # Sort contents of directory, excluding non-media files and folders. If the path is TV_PATH, exclude folders too
-        if search_path == PathManager.TV_PATH:
-            sorted_contents: list = [path for path in search_path.iterdir() if
-                                     path.suffix in PathManager.VIDEO_EXTENSIONS
-                                     and path.stem != ".scheme" and not path.is_dir()]
-        else:
-            sorted_contents: list = [path for path in search_path.iterdir() if
-                                     (path.suffix in PathManager.VIDEO_EXTENSIONS or path.is_dir())
-                                     and path.stem != ".scheme"]
+        if not self.episode_order.episodes:
+            raise IndexError("Show has no episodes.")
 
-        self.human_sort(sorted_contents)
+        self.episode_index = self.find_index(search_path)
 
-        try:
-            first_episode: Path = sorted_contents[0]
-        except IndexError as err:
-            raise err
+        # The show folder itself is not part of the episode order
+        if self.episode_index is None:
+            self.episode_index = 0
 
         # Write the first episode to file if write is true.
         if write:
-            self.write_next_episode(first_episode)
-
-        # If the first value of the returned content is a directory, search in that directory
-        if first_episode.is_dir():
-            try:
-                first_episode = self.get_first_episode(first_episode, write=write)
-            # Handle situations where first directory is empty
-            except IndexError:
-                first_episode = self.find_next_episode(first_episode, first_episode.parent, write=write)
-
-        # Increment the current episode depth and set the current episode
-        self.episode_depth += 1
-
-        # Set current episode. If it fails value error checks, then set to none
-        try:
-            self.current_episode = first_episode
-        except ValueError:
-            self.current_episode = Path()
+            self.write_episode_markers(self.current_episode)
 
         return self.current_episode
 
     def get_current_episode(self, show_path: Path) -> Path:
         """
-        Uses the .eps file to search and return the first episode. If .eps file does not exist, find the first episode
+        Uses the marker store to return the current episode. If the show has no marker, finds the first episode.
         :param show_path: Path of the show to get current episode for
         """
-        if self.current_episode.exists() and self.current_episode.is_file():
+        if self.episode_index is not None:
             return self.current_episode
 
-        eps_file_path: Path = show_path.joinpath(".eps.txt")
-
-        # If .eps file does not exist, populate with first episode of show and return first episode
-        if not eps_file_path.exists() or not eps_file_path.stat().st_size:
-            try:
-                return self.get_first_episode(show_path)
-
-            # If there is no first episode, find the next episode from the top-level path
-            except IndexError:
-                sorted_contents: list = [path for path in self.path.iterdir() if
-                                         (path.suffix in PathManager.VIDEO_EXTENSIONS or path.is_dir())
-                                         and path.stem != ".scheme"]
+        if not self.episode_order.episodes:
+            return self.current_episode
 
-                self.human_sort(sorted_contents)
+        marker = MarkerStore.get_store().get(show_path)
 
-                return self.find_next_episode(sorted_contents[0], self.path, write=True)
+        # If there is no marker, start from the first episode of the show
+        if marker is None:
+            return self.get_first_episode(show_path, write=False)
 
-        # Otherwise, get current episode from .eps file
-        current_episode: Path = Path(eps_file_path.read_text())
+        # Markers imported from .eps files can point to a folder, so use the first episode at or after it
+        self.current_episode = marker
 
-        if current_episode.is_dir():
-            current_episode = self.get_current_episode(current_episode)
+        # If the episode or folder has been renamed or deleted, carry on from the episode that followed it, or from the
+        # first episode if the marker is no longer part of the show, and point the marker there
+        if self.episode_index is None:
+            self.episode_index = self.find_following_index(marker)
+            if self.episode_index is None:
+                self.episode_index = 0
 
-        # Increment the current episode depth and set the current episode
-        self.episode_depth += 1
-
-        # Set current episode. If it fails value error checks, then set to none
-        try:
-            self.current_episode = current_episode
-        except ValueError:
-            self.current_episode = Path()
+            MarkerStore.get_store().repair(show_path, self.current_episode)
 
         return self.current_episode
 
-    def find_next_episode(self, search_item: Path, search_path: Path, write: bool = False) -> Path:
+    def find_next_episode(self, write: bool = False) -> Path:
         """
-        Searches for the next episode or season. If the final episode or season, returns the first one
-        :param search_item: The target of the search. It will look for the element that is after this one.
-        :param search_path: The path of the search.
+        Moves to the next episode in the show. Empty folders are skipped, and the final episode wraps to the first one.
         :param write: Whether or not to write the changes to file
         """
-        # if the search item is already a media file, search only media files (assumes we are in media folder)
-        if search_path == PathManager.TV_PATH:
-            sorted_paths: list = [path for path in search_path.iterdir() if
-                                  path.suffix in PathManager.VIDEO_EXTENSIONS
-                                  and path.stem != ".scheme" and not path.is_dir()]
-
-        # Search for next episode in show folder
-        else:
-            sorted_paths: list = [path for path in search_path.iterdir() if
-                                  (path.suffix in PathManager.VIDEO_EXTENSIONS or path.is_dir())
-                                  and path.stem != ".scheme"]
-
-        self.human_sort(sorted_paths)
+        if self.episode_index is None:
+            return self.current_episode
 
-        # Try indexing the path in the sorted list to determine its position
-        try:
-            path_number: int = sorted_paths.index(search_item)
-        except ValueError:
-            return
+        self.episode_index = (self.episode_index + 1) % len(self.episode_order)
 
-        # Grab the next episode if it is not the last episode
-        try:
-            next_path: Path = sorted_paths[path_number + 1]
+        if write:
+            self.write_episode_markers(self.current_episode)
 
-            # If the write flag is set to True, write this. This only would be used in situations where the
-            # find_next_episode method is called for finding the first episode in a series
-            if write:
-                self.write_next_episode(next_path)
+        return self.current_episode
 
-        # If final episode in the folder, move up a folder and repeat same search.
-        # If we arrive in the tv path folder, return the first episode of the show and reset the episode depth
-        except IndexError:
-            if self.episode_depth - 1 <= 0:
-                self.episode_depth = 0
-                return self.get_first_episode(self.path, write=write)
+    def next_episodes(self, count: int, include_current: bool = False, estimate: bool = False) -> list:
+        """
+        Returns the episodes that follow the current one, wrapping to the first at the end of the show, without moving
+        the current episode. Their durations are looked up together, probing any that are not cached in parallel.
+        :param count: Number of episodes to return. Fewer are returned if the show is shorter
+        :param include_current: Start from the current episode rather than the one after it
+        :param estimate: Estimate durations from file sizes, as with estimated_duration, instead of probing
+        :return: List of (episode, index, depth, duration in minutes or None, True if the duration is an estimate).
+                 Depth is the number of folders between the show folder and the episode
+        """
+        if self.episode_index is None or not self.episode_order.episodes:
+            return []
 
-            self.episode_depth -= 1
+        length: int = len(self.episode_order)
+        start: int = self.episode_index if include_current else self.episode_index + 1
+        indexes: list = [(start + offset) % length for offset in range(min(count, length))]
+        episodes: list = [self.episode_order.episodes[index] for index in indexes]
 
-            return self.find_next_episode(search_item.parent, search_path.parent, write=write)
+        cache: DurationCache = DurationCache.get_cache()
+        lookup = cache.estimate if estimate else lambda episode: (cache.duration(episode), False)
 
-        # If we have not reached a media file yet, continue down until one is found.
-        # From the new search path, find the first episode in the new subfolder
-        if next_path.is_dir():
-            try:
-                next_path = self.get_first_episode(next_path, write=write)
-            # If the file directory is blank, increment the depth counter and return the previous episode
-            except IndexError:
-                self.episode_depth -= 1
-                return sorted_paths[path_number]
+        with Profiler.phase(Profiler.DURATION_PROBING):
+            if estimate or len(episodes) < 2:
+                durations: list = [lookup(episode) for episode in episodes]
+            else:
+                with ThreadPoolExecutor(max_workers=min(DurationProbe.PARALLEL_PROBES, len(episodes))) as executor:
+                    durations: list = list(executor.map(lookup, episodes))
 
-        return next_path
+        return [(episode, index, len(self.episode_order.keys[index]) - 1, duration, estimated)
+                for episode, index, (duration, estimated) in zip(episodes, indexes, durations)]
 
-    # -------------------- Static Methods -----------------------
-    @staticmethod
-    def write_next_episode(video: Path):
+    def write_episode_markers(self, video: Path):
         """
-        Writes the next video to the .eps file.
-        :param video: Next video in series
+        Saves the video as the show's current episode in the marker store.
+        :param video: Episode to mark as current
         :return: None
         """
-        # Overwrite .eps file with next episode
-        with open(video.parent.joinpath(".eps.txt"), "w") as file:
-            file.write(video.as_posix())
+        MarkerStore.get_store().set(self.path, video)
 
+    # -------------------- Static Methods -----------------------
     @staticmethod
-    def clear_episode_files(path: Path = PathManager.TV_PATH):
+    def clear_episode_files(path: Path = PathManager.TV_PATH, show_paths: list = None) -> dict:
         """
-        Clears all episode files across TV directory
-        :return: None
+        Clears episode markers, and any .eps files left by older versions, across TV directory
+        :param path: Folder to clear. Markers are only cleared from the top of the TV directory, while other folders
+                     just have their .eps files deleted
+        :param show_paths: Optional list of shows to reset, such as Scheme.show_paths(). Defaults to every show
+        :return: Number of markers and .eps files removed
         """
-        # Delete .eps file from directory
-        episode_file = path.joinpath(".eps.txt")
-        if episode_file.exists():
-            episode_file.unlink()
+        store: MarkerStore = MarkerStore.get_store()
+
+        if path == PathManager.TV_PATH:
+            return store.reset(show_paths)
 
-        # Recursively delete .eps file from all lower paths
-        [Show.clear_episode_files(folder) for folder in path.iterdir() if folder.is_dir()]
+        return {"markers": 0, "eps_files": store.delete_eps_files([(path, True)])}
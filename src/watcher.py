@@ -0,0 +1,251 @@
+# Background watcher that applies changes in the TV_PATH to the library index as they happen
+from src.helper import PathManager
+from src.library import Library
+
+from pathlib import Path
+import os
+import threading
+
+
+class LibraryWatcher:
+    """
+    Keeps a library's index, listings and episode orders up to date while the programme runs, so that confirming the
+    TV_PATH or generating a playlist does not have to rescan the whole library.
+    Uses inotify where the optional inotify_simple package is installed and the platform supports it, and otherwise
+    polls the mtime of each indexed directory.
+    """
+    # --------------------- Class Variables -----------------------------
+    POLL_INTERVAL: float = 30
+
+    # Copying a season in creates a burst of events, so changes are applied once no more have arrived for this long
+    READ_TIMEOUT: float = 0.5
+
+    # Running watchers, keyed by TV_PATH
+    _watchers: dict = {}
+    _watchers_lock = threading.Lock()
+
+    def __init__(self, library: Library, use_inotify: bool = None, interval: float = POLL_INTERVAL):
+        """
+        :param library: Library to keep up to date
+        :param use_inotify: True or False to force a mode. Defaults to inotify where available
+        :param interval: Seconds between polls, when polling
+        """
+        self.library: Library = library
+        self.use_inotify: bool = use_inotify
+        self.interval: float = interval
+
+        self.thread: threading.Thread = None
+        self.stop_event: threading.Event = threading.Event()
+        self.lock = threading.Lock()
+
+        # inotify state: the watch descriptor of each watched directory, and directories with unapplied events
+        self.inotify = None
+        self.flags = None
+        self.watches: dict = {}
+        self.pending: set = set()
+
+        # Number of directories brought up to date, for reporting
+        self.changes: int = 0
+
+    @classmethod
+    def watch(cls, library: Library = None, use_inotify: bool = None, interval: float = POLL_INTERVAL):
+        """
+        Starts watching a library, stopping watchers of any other TV_PATH. A library that is already watched keeps its
+        watcher.
+        :param library: Defaults to the library for PathManager.TV_PATH
+        :param use_inotify: True or False to force a mode. Defaults to inotify where available
+        :param interval: Seconds between polls, when polling
+        :return: LibraryWatcher
+        """
+        library = library or Library.get_library()
+
+        with cls._watchers_lock:
+            for tv_path, watcher in list(cls._watchers.items()):
+                if watcher.library is not library:
+                    watcher.stop()
+
+            watcher = cls._watchers.get(library.tv_path)
+            if watcher is None or not watcher.running:
+                watcher = LibraryWatcher(library, use_inotify, interval)
+                watcher.start()
+
+        return watcher
+
+    @classmethod
+    def stop_all(cls):
+        with cls._watchers_lock:
+            for watcher in list(cls._watchers.values()):
+                watcher.stop()
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    @property
+    def mode(self) -> str:
+        return "inotify" if self.inotify is not None else "poll"
+
+    def start(self):
+        if self.use_inotify is not False:
+            self.open_inotify()
+
+        self.library.watcher = self
+        self._watchers[self.library.tv_path] = self
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+
+        if self.inotify is not None:
+            self.inotify.close()
+
+        if self.library.watcher is self:
+            self.library.watcher = None
+
+        if self._watchers.get(self.library.tv_path) is self:
+            del self._watchers[self.library.tv_path]
+
+    def run(self):
+        while not self.stop_event.is_set():
+            if self.inotify is not None:
+                with self.lock:
+                    self.apply_events(self.READ_TIMEOUT, wait_for_quiet=True)
+            elif not self.stop_event.wait(self.interval):
+                self.sync()
+
+    def sync(self) -> int:
+        """
+        Applies any changes that have happened since the last sync, without waiting for the background thread.
+        :return: Number of directories that were brought up to date
+        """
+        with self.lock:
+            if self.inotify is not None:
+                return self.apply_events(0)
+
+            return self.poll()
+
+    # --------------------- Polling ----------------------------
+    def poll(self) -> int:
+        """
+        Stats every indexed directory and relists those whose mtime has changed.
+        """
+        with self.library.lock:
+            directories: list = self.library.connection.execute("SELECT path, mtime FROM directories").fetchall()
+
+        changed: list = []
+        for key, mtime in directories:
+            try:
+                if os.stat(self.library.absolute(key)).st_mtime != mtime:
+                    changed.append(key)
+            except OSError:
+                changed.append(key)
+
+        if changed:
+            self.library.refresh(changed)
+            self.changes += len(changed)
+
+        return len(changed)
+
+    # --------------------- inotify ----------------------------
+    def open_inotify(self):
+        """
+        Watches every indexed directory with inotify, leaving the watcher to poll if it is not available.
+        """
+        try:
+            from inotify_simple import INotify, flags
+        except ImportError:
+            return
+
+        try:
+            self.inotify = INotify()
+        except OSError:
+            return
+
+        self.flags = flags
+        with self.library.lock:
+            keys: list = [row[0] for row in self.library.connection.execute("SELECT path FROM directories")]
+
+        if not self.add_watches(keys):
+            self.inotify.close()
+            self.inotify = None
+
+    def add_watches(self, keys: list) -> bool:
+        """
+        :return: False if the system limit on watches has been reached
+        """
+        mask = self.flags.CREATE | self.flags.DELETE | self.flags.MOVED_FROM | self.flags.MOVED_TO | \
+            self.flags.CLOSE_WRITE | self.flags.DELETE_SELF
+
+        for key in keys:
+            try:
+                self.watches[self.inotify.add_watch(self.library.absolute(key), mask)] = key
+            except FileNotFoundError:
+                continue
+            except OSError:
+                return False
+
+        return True
+
+    def apply_events(self, timeout: float, wait_for_quiet: bool = False) -> int:
+        """
+        Reads inotify events, then relists the directories they happened in.
+        :param timeout: Seconds to wait for events if there are none yet
+        :param wait_for_quiet: Hold changes back until a read finds no more events
+        :return: Number of directories that were brought up to date
+        """
+        events: list = list(self.inotify.read(timeout=int(timeout * 1000)))
+
+        for event in events:
+            # Too many events were missed, so the whole library has to be checked
+            if event.mask & self.flags.Q_OVERFLOW:
+                self.library.rescan()
+                self.pending.clear()
+                continue
+
+            key: str = self.watches.get(event.wd)
+            if key is None:
+                continue
+
+            if event.mask & self.flags.IGNORED:
+                del self.watches[event.wd]
+                continue
+
+            # Only videos and folders are indexed, so .eps files and other writes are ignored
+            if event.mask & self.flags.ISDIR:
+                if event.name == ".scheme":
+                    continue
+            elif event.name and Path(event.name).suffix not in PathManager.VIDEO_EXTENSIONS:
+                continue
+
+            # A directory that is removed is taken out of the index when its parent is relisted
+            if event.mask & self.flags.DELETE_SELF:
+                key = key.rpartition("/")[0] or Library.ROOT
+
+            self.pending.add(key)
+
+        if not self.pending or (events and wait_for_quiet):
+            return 0
+
+        keys: list = list(self.pending)
+        self.pending.clear()
+
+        added: list = self.library.refresh(keys, relist=True)
+        if not self.add_watches(added):
+            self.fall_back_to_polling()
+
+        self.changes += len(keys)
+        return len(keys)
+
+    def fall_back_to_polling(self):
+        self.inotify.close()
+        self.inotify = None
+        self.watches.clear()
+
+
+if __name__ == "__main__":
+    pass
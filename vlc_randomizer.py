@@ -1,7 +1,9 @@
 from src.scheme import Scheme
 from src.helper import PathManager
+from src.library import Library
 from src.playlist import Playlist
 from src.gui import Interface
+from src.watcher import LibraryWatcher
 
 import PySimpleGUI as sg
 from pathlib import Path
@@ -23,21 +25,17 @@ if __name__ == "__main__":
         event, values = window.read(timeout=1000)
         # End programme if user closes window
         if event == sg.WIN_CLOSED:
+            interface.cancel_generation()
             break
 
         # --------------- Main Layout Event Checks -----------------------
 
-        # If TV_PATH entered, validate and set TV_PATH variable in PathManager. Otherwise, throw error.
+        # If TV_PATH entered, validate it. Otherwise, throw error. PathManager.TV_PATH is only changed once it is
+        # confirmed, since a playlist may still be generating from the current one
         elif event == "-TV_PATH-":
             tv_path = Path(values["-TV_PATH-"])
             try:
-                if tv_path.exists():
-                    PathManager.TV_PATH = tv_path
-                    try:
-                        PathManager.TV_PATH.joinpath(".scheme").mkdir()
-                    except FileExistsError:
-                        pass
-                else:
+                if not tv_path.exists():
                     interface.error_message("Invalid Path.")
             except OSError:
                 interface.error_message("Invalid Path.")
@@ -47,8 +45,18 @@ if __name__ == "__main__":
             tv_path = Path(values["-TV_PATH-"])
             try:
                 if tv_path.exists():
+                    # Stop any playlist being generated from the old TV_PATH, waiting for it so that it cannot resolve
+                    # shows against the new one
+                    interface.cancel_generation(wait=True)
                     PathManager.TV_PATH = tv_path
 
+                    # Bring the library index up to date with any changes made since it was last scanned.
+                    # Once it is being watched, only the changes the watcher has not yet applied are needed
+                    library = Library.get_library(tv_path, rescan=True)
+
+                    if PathManager.WATCH_LIBRARY:
+                        LibraryWatcher.watch(library)
+
                     # If main buttons not yet cascaded, expand them.
                     if "-GEN_PLAYLIST-" not in window.key_dict:
                         window.size = 1200, 800
@@ -75,7 +83,7 @@ if __name__ == "__main__":
 
                     # Hide Scheme info
                     interface.hide_elements(window,
-                                            f"-SCHEME_DETAILS-{interface.scheme.title.upper()}-",
+                                            "-SCHEME_DETAILS-",
                                             "-SAVE_SCHEME-",
                                             "-DISCARD_SCHEME-")
 
@@ -124,6 +132,9 @@ if __name__ == "__main__":
             if not values["-PL_SCHEME_PATH-"]:
                 continue
 
+            # Stop any playlist still being generated from the previous scheme
+            interface.cancel_generation()
+
             try:
                 interface.scheme = Scheme.load_playlist_scheme(values["-PL_SCHEME_PATH-"][0])
             except FileNotFoundError:
@@ -134,25 +145,56 @@ if __name__ == "__main__":
 
         # Display the current playlist to the user and cascade Launch VLC button if not already expanded
         elif event == "-PL_CONFIRM_PLAYLIST-":
+            # Wait for a cancelled generation to finish before starting another
+            if interface.generating:
+                continue
+
             if values["-VLC_PATH-"] and values["-PL_DURATION-"] and values["-PL_SCHEME_PATH-"]:
+                # Clear playlist, then regenerate in the background. Episodes are added to the view as they are picked
+                interface.start_generation(window)
+
                 # Extend layout with phase 3 sections
                 if "-LAUNCH_VLC-" not in window.key_dict:
-                    interface.playlist.generate_playlist(interface.scheme)
                     window.extend_layout(window["-PLAYLIST-"], interface.playlist_phase_3())
 
                 # If path has been changed, update view playlist element and unhide
                 else:
-                    # Clear playlist, then regenerate
-                    interface.playlist.clear_playlist()
-                    interface.playlist.generate_playlist(interface.scheme)
-                    window["-VIEW_PLAYLIST-"].update(values=[vid.stem for vid in interface.playlist.video_queue])
+                    window["-VIEW_PLAYLIST-"].update(values=[])
 
                     # Add components back
                     interface.unhide_elements(window, "-VIEW_PLAYLIST-", "-LAUNCH_VLC-")
 
-        # Launch VLC with the current playlist
+                interface.show_generation_state(window, True, "Checking shows...")
+
+        # Add episodes to the playlist view as the background generation picks them
+        elif event == "-PL_PROGRESS-":
+            interface.show_progress(window, *values[event])
+
+        # Once generation has finished, allow the playlist to be launched
+        elif event == "-PL_GENERATED-":
+            report = values[event]
+            status = f"{len(interface.playlist_view)} episodes, {round(report.minutes)} mins"
+            interface.show_generation_state(window, False, "Cancelled: " + status if report.cancelled else status)
+
+        elif event == "-PL_FAILED-":
+            interface.show_generation_state(window, False, "Generation failed")
+            interface.error_message(f"Unable to generate playlist: {values[event]}")
+
+        elif event == "-PL_CANCEL-":
+            interface.cancel_generation()
+
+        # Launch VLC with the current playlist, once it has finished generating
         elif event == "-LAUNCH_VLC-":
-            interface.run_playlist()
+            if interface.generating:
+                continue
+
+            # Keep the window open if VLC could not be controlled, so that the playlist can be launched again
+            try:
+                interface.run_playlist()
+            except ConnectionError as err:
+                interface.error_message(f"Unable to control VLC: {err}")
+                continue
+
             break
 
         # --------------- Scheme Layout Event Checks -----------------------
@@ -170,7 +212,7 @@ if __name__ == "__main__":
             # Hide phase 4 rows
             interface.hide_elements(window,
                                     "-SAVE_SCHEME-",
-                                    f"-SCHEME_DETAILS-{interface.scheme.title.upper()}-",
+                                    "-SCHEME_DETAILS-",
                                     "-DISCARD_SCHEME-",
                                     "-SCHEME_SUCCESS-")
 
@@ -188,7 +230,7 @@ if __name__ == "__main__":
             # Hide phase 4 rows
             interface.hide_elements(window,
                                     "-SAVE_SCHEME-",
-                                    f"-SCHEME_DETAILS-{interface.scheme.title.upper()}-",
+                                    "-SCHEME_DETAILS-",
                                     "-DISCARD_SCHEME-",
                                     "-SCHEME_SUCCESS-")
 
@@ -202,7 +244,7 @@ if __name__ == "__main__":
             # Hide phase 4 rows
             interface.hide_elements(window,
                                     "-SAVE_SCHEME-",
-                                    f"-SCHEME_DETAILS-{interface.scheme.title.upper()}-",
+                                    "-SCHEME_DETAILS-",
                                     "-DISCARD_SCHEME-",
                                     "-SCHEME_SUCCESS-")
 
@@ -210,7 +252,7 @@ if __name__ == "__main__":
             # Hide phase 4 rows
             interface.hide_elements(window,
                                     "-SAVE_SCHEME-",
-                                    f"-SCHEME_DETAILS-{interface.scheme.title.upper()}-",
+                                    "-SCHEME_DETAILS-",
                                     "-DISCARD_SCHEME-",
                                     "-SCHEME_SUCCESS-")
 
@@ -226,14 +268,11 @@ if __name__ == "__main__":
             if "-SAVE_SCHEME-" not in window.key_dict:
                 window.extend_layout(window["-SCHEME-"], interface.scheme_phase_4())
 
-            # If specific instance of scheme is not already loaded, extend the window with it
-            elif f"-SCHEME_DETAILS-{interface.scheme.title.upper()}-" not in window.key_dict:
-                window.extend_layout(window["-SCHEME-"], [[interface.import_scheme()]])
-
             else:
-                # Reset scroll bar and unhide the scheme section
-                window[f"-SCHEME_DETAILS-{interface.scheme.title.upper()}-"].contents_changed()
-                interface.unhide_elements(window, f"-SCHEME_DETAILS-{interface.scheme.title.upper()}-")
+                # Show the scheme in the existing editor rows, then reset scroll bar and unhide the scheme section
+                interface.open_scheme_editor(window)
+                window["-SCHEME_DETAILS-"].contents_changed()
+                interface.unhide_elements(window, "-SCHEME_DETAILS-")
 
             interface.unhide_elements(window, "-SAVE_SCHEME-", "-DISCARD_SCHEME-")
 
@@ -246,29 +285,40 @@ if __name__ == "__main__":
             if "-SAVE_SCHEME-" not in window.key_dict:
                 window.extend_layout(window["-SCHEME-"], interface.scheme_phase_4())
 
-            # If specific instance of scheme is not already loaded, extend the window with it
-            elif f"-SCHEME_DETAILS-{interface.scheme.title.upper()}-" not in window.key_dict:
-                window.extend_layout(window["-SCHEME-"], [[interface.import_scheme()]])
-
             else:
-                # Reset scroll bar and unhide the scheme section
-                window[f"-SCHEME_DETAILS-{interface.scheme.title.upper()}-"].contents_changed()
-                interface.unhide_elements(window, f"-SCHEME_DETAILS-{interface.scheme.title.upper()}-")
+                # Show the scheme in the existing editor rows, then reset scroll bar and unhide the scheme section
+                interface.open_scheme_editor(window)
+                window["-SCHEME_DETAILS-"].contents_changed()
+                interface.unhide_elements(window, "-SCHEME_DETAILS-")
 
             interface.unhide_elements(window, "-SAVE_SCHEME-", "-DISCARD_SCHEME-")
 
+        # Frequencies entered are kept in the editor until the scheme is saved, so they survive changing page
+        elif isinstance(event, str) and event.startswith("-SCHEME_FREQ_"):
+            interface.record_scheme_edits(values)
+
+        # Filter the scheme rows by show, starting again from the first page
+        elif event == "-SCHEME_FILTER-":
+            interface.record_scheme_edits(values)
+            interface.scheme_editor.set_filter(values["-SCHEME_FILTER-"])
+            interface.show_scheme_page(window)
+
+        elif event in ["-SCHEME_PREV-", "-SCHEME_NEXT-"]:
+            interface.record_scheme_edits(values)
+            interface.scheme_editor.set_page(interface.scheme_editor.page + (1 if event == "-SCHEME_NEXT-" else -1))
+            interface.show_scheme_page(window)
+
         # When the save button is pressed, 2 key functions are performed:
-        #   1. The changes are compiled in interface.scheme.data
-        #   2. The changes to the dataframe are saved to file
+        #   1. The changed frequencies are compiled in the scheme data
+        #   2. The changes to the scheme are saved to file
         # If successful, extends or unhides a success message
         elif event == "-SAVE_SCHEME-":
             try:
-                # Incorporate changes to frequency for show to dataframe, then save changes
-                for index in interface.scheme.data.index.values:
-                    # If value is not entered, fill with a 0
-                    interface.scheme.data.at[index, "frequency"] = values[f"-SCHEME_FREQ_{index}-"] \
-                        if values[f"-SCHEME_FREQ_{index}-"] else 0
-                interface.scheme.save_scheme()
+                # Incorporate changes to frequency for show to the scheme, then save changes. Blank values become 0
+                interface.record_scheme_edits(values)
+                interface.scheme_editor.apply()
+                interface.scheme_editor.scheme.save_scheme()
+                interface.show_scheme_page(window)
 
                 # If a new scheme was added, make sure it is reflected in the playlist generation screen
                 if "-PL_SCHEME_PATH-" in window.key_dict:
@@ -290,22 +340,19 @@ if __name__ == "__main__":
         # If Discard Scheme, reload the scheme from above and hide the success message
         elif event == "-DISCARD_SCHEME-":
             try:
-                interface.scheme.refresh_scheme()
-
-                for index in interface.scheme.data.index.values:
-                    window[f"-SCHEME_SHOW_{index}-"].update(interface.scheme.data.at[index, "show_path"])
-                    window[f"-SCHEME_FREQ_{index}-"].update(interface.scheme.data.at[index, "frequency"])
+                interface.scheme_editor.reload()
+                interface.show_scheme_page(window)
 
                 # Hide phase 4 rows
                 interface.hide_elements(window,
-                                        f"-SCHEME_DETAILS-{interface.scheme.title.upper()}-",
+                                        "-SCHEME_DETAILS-",
                                         "-SAVE_SCHEME-",
                                         "-DISCARD_SCHEME-",
                                         "-SCHEME_SUCCESS-")
 
             except FileNotFoundError:
                 interface.hide_elements(window,
-                                        f"-SCHEME_DETAILS-{interface.scheme.title.upper()}-",
+                                        "-SCHEME_DETAILS-",
                                         "-SAVE_SCHEME-",
                                         "-DISCARD_SCHEME-",
                                         "-SCHEME_SUCCESS-")
@@ -358,12 +405,18 @@ if __name__ == "__main__":
         elif event == "-SAVE_SHOW-":
             episode = Path(values["-SELECT_EPISODE-"])
             try:
-                if episode.exists():
-                    show.write_next_episode(episode)
-                else:
+                if not episode.exists():
                     interface.error_message(f"Invalid Path: {episode.as_posix()}")
                     continue
-            except OSError as err:
+
+                # Only an episode of this show can be a marker, otherwise the show would never be found again
+                if show.find_index(episode) is None:
+                    interface.error_message(f"Episode not found in {show.path.name}: {episode.as_posix()}")
+                    continue
+
+                show.write_episode_markers(episode)
+            # Episodes outside the TV_PATH cannot be used as markers
+            except (OSError, ValueError) as err:
                 interface.error_message(f"Invalid Path: {err}")
                 continue
 
@@ -387,5 +440,18 @@ if __name__ == "__main__":
 
     window.close()
 
+    # In controller mode, keep feeding VLC until the playlist has finished or VLC is closed. The controller collects
+    # its own errors saving markers, which are reported with any others below
+    controller_errors: list = []
+    if interface.controller is not None:
+        interface.controller.run()
+        controller_errors = interface.controller.errors
+
+    # Make sure markers from a launched playlist are saved before exiting
+    if PathManager.TV_PATH and (interface.playlist.next_episode_dict or controller_errors):
+        interface.finish_markers(controller_errors)
+
+    LibraryWatcher.stop_all()
+
     # Save any paths that have been changed during programme run
     PathManager.save_paths()
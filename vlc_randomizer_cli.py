@@ -0,0 +1,6 @@
+from src.cli import CommandLine
+
+import sys
+
+if __name__ == "__main__":
+    sys.exit(CommandLine.main())